@@ -0,0 +1,75 @@
+# This file benchmarks the cold-start latency of one-shot engine invocations,
+# which dominates short searches when a process is spawned per position.
+#
+#   python benchmarks/startup.py --runs 20
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Sequence
+
+# A middlegame position, searched with a tiny node budget so that the timings
+# measure startup rather than search
+FEN = "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+
+COMMANDS = {
+    "python": [sys.executable, "-c", "pass"],
+    "import chess": [sys.executable, "-c", "import chess"],
+    "import osmanthus.cli": [sys.executable, "-c", "import osmanthus.cli"],
+    "bestmove": [
+        sys.executable, "-m", "osmanthus.cli", "bestmove", "--fen", FEN,
+        "--nodes", "1", "--no-book",
+    ],
+}
+
+
+def time_command(command: Sequence[str], runs: int) -> list[float]:
+    """
+    Runs a command repeatedly and measures its wall-clock time.
+
+    Args:
+        command (Sequence[str]): The command and its arguments.
+        runs (int): Number of timed runs, after one untimed warm-up run.
+
+    Returns:
+        list[float]: The time of each run in seconds.
+    """
+
+    # The first run compiles the bytecode and warms the file system cache
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """
+    Times every command and prints the median and minimum of each.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the cold-start latency of the engine.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=10,
+        help="Timed runs per command. Defaults to 10.",
+    )
+    args = parser.parse_args(argv)
+
+    print(f"{'command':<24}{'median':>10}{'min':>10}")
+    for name, command in COMMANDS.items():
+        timings = time_command(command, args.runs)
+        median = statistics.median(timings) * 1000
+        print(f"{name:<24}{median:>8.1f}ms{min(timings) * 1000:>8.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
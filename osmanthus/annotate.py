@@ -0,0 +1,176 @@
+# This file implements a streaming PGN annotator. Games are read one at a time
+# and analysed in worker processes, so memory stays flat for any archive size.
+from __future__ import annotations
+
+import io
+import sys
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from typing import TextIO
+
+import chess
+import chess.pgn
+
+from osmanthus import endgame
+from osmanthus import engine
+
+# Centipawn losses for each judgment, as (threshold, NAG, label)
+JUDGMENTS = [
+    (300, chess.pgn.NAG_BLUNDER, "Blunder"),
+    (100, chess.pgn.NAG_MISTAKE, "Mistake"),
+    (50, chess.pgn.NAG_DUBIOUS_MOVE, "Inaccuracy"),
+]
+
+
+def read_games(source: TextIO) -> Iterator[str]:
+    """
+    Streams the games of a PGN file, one at a time.
+
+    Args:
+        source (TextIO): The PGN input.
+
+    Yields:
+        str: Each game exported as PGN.
+    """
+
+    while (game := chess.pgn.read_game(source)) is not None:
+        yield str(game)
+
+
+def analyse_position(
+    board: chess.Board, depth: int, limit: float,
+) -> tuple[int, chess.Move | None]:
+    """
+    Searches a position without the opening book.
+
+    Args:
+        board (chess.Board): The position to analyse.
+        depth (int): The maximum search depth.
+        limit (float): The time limit in seconds.
+
+    Returns:
+        tuple[int, chess.Move | None]: The score from white's point of view
+        and the best move, or None if the game is over.
+    """
+
+    if board.is_checkmate():
+        return sys.maxsize * (-1)**board.turn, None
+    if board.is_game_over():
+        return 0, None
+
+    move = engine.get_engine_move(board, depth, limit, book=False)
+    return int(engine.DEBUG_INFO.get("score", 0)), move
+
+
+def format_score(score: int) -> str:
+    """
+    Formats a score as a PGN comment.
+
+    Args:
+        score (int): The score from white's point of view, in centipawns.
+
+    Returns:
+        str: An `[%eval]` command, or the winning side if a mate was found.
+    """
+
+    if abs(score) >= engine.MATE_THRESHOLD:
+        return "White mates." if score > 0 else "Black mates."
+    return f"[%eval {score / 100:.2f}]"
+
+
+def annotate_game(pgn: str, depth: int = 3, limit: float = 5) -> str:
+    """
+    Annotates the mainline of a game with evaluations, and marks inaccuracies,
+    mistakes and blunders along with the move the engine preferred. The
+    move-ordering table is reused across the consecutive positions of the game
+    and cleared before the next one.
+
+    Args:
+        pgn (str): The game in PGN notation.
+        depth (int, optional): The maximum search depth per position.
+        limit (float, optional): The time limit per position in seconds.
+
+    Returns:
+        str: The annotated game in PGN notation.
+    """
+
+    game = chess.pgn.read_game(io.StringIO(pgn))
+    if game is None:
+        return pgn
+
+    # Start every game with an empty table, so memory doesn't accumulate
+    engine.move_scores.clear()
+
+    # Load the endgame tables once per process, outside the search clock
+    endgame.load_tables()
+
+    board = game.board()
+    score, best_move = analyse_position(board, depth, limit)
+    for node in game.mainline():
+        mover = board.turn
+        best_san = board.san(best_move) if best_move else None
+        board.push(node.move)
+        previous_score = score
+        score, next_best_move = analyse_position(board, depth, limit)
+
+        comments = [format_score(score)]
+
+        # Judge the move by the score it lost for the side that played it
+        if best_move and node.move != best_move:
+            loss = (previous_score - score) * (-1)**(not mover)
+            for threshold, nag, label in JUDGMENTS:
+                if loss >= threshold:
+                    node.nags.add(nag)
+                    comments.append(f"{label}. Best move was {best_san}.")
+                    break
+
+        node.comment = " ".join([node.comment, *comments]).strip()
+        best_move = next_best_move
+
+    return str(game)
+
+
+def annotate(
+    source: TextIO, output: TextIO, depth: int = 3, limit: float = 5,
+    workers: int = 1,
+) -> int:
+    """
+    Annotates every game of a PGN stream, writing each game as soon as it and
+    all games before it are done. At most two games per worker are in flight.
+
+    Args:
+        source (TextIO): The PGN input.
+        output (TextIO): Where the annotated games are written.
+        depth (int, optional): The maximum search depth per position.
+        limit (float, optional): The time limit per position in seconds.
+        workers (int, optional): Worker processes; 1 analyses in-process.
+
+    Returns:
+        int: The number of games annotated.
+    """
+
+    count = 0
+
+    def write(pgn: str) -> None:
+        nonlocal count
+        output.write(f"{pgn}\n\n")
+        output.flush()
+        count += 1
+
+    if workers <= 1:
+        for pgn in read_games(source):
+            write(annotate_game(pgn, depth, limit))
+        return count
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending: deque[Future[str]] = deque()
+        for pgn in read_games(source):
+            pending.append(pool.submit(annotate_game, pgn, depth, limit))
+            # Bound the games held in memory, preserving the input order
+            if len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    return count
@@ -1,42 +1,253 @@
 from __future__ import annotations
 
 import argparse
-import logging
 import os
+import sys
+from collections.abc import Sequence
 
 import chess
 
+from osmanthus import endgame
+from osmanthus.engine import GameSession
 from osmanthus.engine import get_engine_move
+from osmanthus.evaluate import load_weights
 # from chess import pgn
 
 
-# Set up the command line argument parser
-parser = argparse.ArgumentParser(
-    description="Play chess against an engine in the terminal.",
-)
-parser.add_argument(
-    "--debug", action="store_true",
-    help="Enable debug logging.",
-)
-parser.add_argument(
-    "--selfplay", action="store_true",
-    help="Engine plays against itself.",
-)
-parser.add_argument(
-    "--depth", type=int, default=3,
-    help="Engine search depth. Defaults to 3.",
-)
-parser.add_argument(
-    "--limit", type=int, default=15,
-    help="Engine time limit. Defaults to 15.",
-)
-parser.add_argument(
-    "--fen", type=str, default=chess.STARTING_FEN,
-    help="Starting position in FEN notation.",
-)
-
-
-def main() -> int:
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Set up the command line argument parser. It is built on demand rather than
+    at import, which keeps short-lived invocations fast.
+
+    Returns:
+        argparse.ArgumentParser: The parser for every command.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Play chess against an engine in the terminal.",
+    )
+    parser.add_argument(
+        "--debug", action="store_true",
+        help="Enable debug logging.",
+    )
+    parser.add_argument(
+        "--selfplay", action="store_true",
+        help="Engine plays against itself.",
+    )
+    parser.add_argument(
+        "--depth", type=int, default=3,
+        help="Engine search depth. Defaults to 3.",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=15,
+        help="Engine time limit. Defaults to 15.",
+    )
+    parser.add_argument(
+        "--nodes", type=int, default=None,
+        help=(
+            "Engine node limit. Replaces the time limit for reproducible "
+            "moves."
+        ),
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None,
+        help="Seed for the opening book choice.",
+    )
+    parser.add_argument(
+        "--no-book", action="store_false", dest="book",
+        help="Don't play moves from the opening book.",
+    )
+    parser.add_argument(
+        "--fen", type=str, default=chess.STARTING_FEN,
+        help="Starting position in FEN notation.",
+    )
+    parser.add_argument(
+        "--weights", type=str,
+        help="Load evaluation weights from a JSON file written by `tune`.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    # Tune the evaluation weights on labelled positions
+    tune_parser = subparsers.add_parser(
+        "tune", help="Tune the evaluation weights on labelled positions.",
+    )
+    tune_parser.add_argument(
+        "data", type=argparse.FileType("r", encoding="utf-8"),
+        help=(
+            "Labelled positions, one '<fen> <result>' per line ('-' for "
+            "stdin)."
+        ),
+    )
+    tune_parser.add_argument(
+        "-o", "--output", type=str, default="weights.json",
+        help="Output weights file. Defaults to weights.json.",
+    )
+    tune_parser.add_argument(
+        "--epochs", type=int, default=20,
+        help="Passes over the data. Defaults to 20.",
+    )
+    tune_parser.add_argument(
+        "--batch-size", type=int, default=16_384,
+        help="Positions per gradient step. Defaults to 16384.",
+    )
+    tune_parser.add_argument(
+        "--learning-rate", type=float, default=1.0,
+        help="Step size in centipawns. Defaults to 1.0.",
+    )
+    tune_parser.add_argument(
+        "-k", type=float, default=1.0,
+        help="Centipawn-to-probability scaling constant. Defaults to 1.0.",
+    )
+
+    # Serve analysis requests from a pool of warm engine processes
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve JSON analysis requests on a local TCP port.",
+    )
+    serve_parser.add_argument(
+        "--host", type=str, default="127.0.0.1",
+        help="Address to listen on. Defaults to 127.0.0.1.",
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=8765,
+        help="Port to listen on. Defaults to 8765.",
+    )
+    serve_parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Engine worker processes. Defaults to the number of CPUs.",
+    )
+    serve_parser.add_argument(
+        "--queue-size", type=int, default=256,
+        help="Queued requests before new ones are rejected. Defaults to 256.",
+    )
+    serve_parser.add_argument(
+        "--deadline", type=float, default=30.0,
+        help="Default per-request deadline in seconds. Defaults to 30.",
+    )
+
+    # Annotate the games of a PGN file with engine analysis
+    annotate_parser = subparsers.add_parser(
+        "annotate",
+        help="Annotate the games of a PGN file with engine analysis.",
+    )
+    annotate_parser.add_argument(
+        "pgn", type=argparse.FileType("r", encoding="utf-8"),
+        help="Input PGN file ('-' for stdin).",
+    )
+    annotate_parser.add_argument(
+        "-o", "--output", type=argparse.FileType("w", encoding="utf-8"),
+        default="-", help="Output PGN file. Defaults to stdout.",
+    )
+    annotate_parser.add_argument(
+        "--depth", type=int, default=3,
+        help="Search depth per position. Defaults to 3.",
+    )
+    annotate_parser.add_argument(
+        "--limit", type=float, default=5,
+        help="Time limit per position in seconds. Defaults to 5.",
+    )
+    annotate_parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1,
+        help="Worker processes. Defaults to the number of CPUs.",
+    )
+
+    # Generate labelled positions from self-play games
+    datagen_parser = subparsers.add_parser(
+        "datagen", help="Generate labelled positions from self-play games.",
+    )
+    datagen_parser.add_argument(
+        "-o", "--output", type=str, default="data",
+        help="Directory to write the shards to. Defaults to data.",
+    )
+    datagen_parser.add_argument(
+        "--games", type=int, default=100,
+        help="Number of games to play. Defaults to 100.",
+    )
+    datagen_parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1,
+        help="Worker processes. Defaults to the number of CPUs.",
+    )
+    datagen_parser.add_argument(
+        "--nodes", type=int, default=5_000,
+        help="Node budget per move. Defaults to 5000.",
+    )
+    datagen_parser.add_argument(
+        "--depth", type=int, default=8,
+        help="Maximum search depth per move. Defaults to 8.",
+    )
+    datagen_parser.add_argument(
+        "--shard-size", type=int, default=1_000_000,
+        help="Maximum positions per shard. Defaults to 1000000.",
+    )
+    datagen_parser.add_argument(
+        "--opening-plies", type=int, default=12,
+        help="Maximum number of random book plies. Defaults to 12.",
+    )
+    datagen_parser.add_argument(
+        "--seed", type=int, default=0,
+        help="Seed for the random openings. Defaults to 0.",
+    )
+
+    # Print the best move of a single position and exit
+    add_bestmove_arguments(subparsers.add_parser(
+        "bestmove", help="Print the best move of a position in UCI notation.",
+    ), inherit=True)
+
+    return parser
+
+
+def add_bestmove_arguments(
+    parser: argparse.ArgumentParser, inherit: bool = False,
+) -> None:
+    """
+    Add the arguments of the `bestmove` subcommand to a parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add them to.
+        inherit (bool, optional): If set, options that aren't given keep the
+        values of the top-level options of the same name, instead of
+        resetting them to their defaults.
+
+    Returns:
+        None.
+    """
+
+    def default(value: object) -> object:
+        return argparse.SUPPRESS if inherit else value
+
+    parser.add_argument(
+        "--fen", type=str, default=default(chess.STARTING_FEN),
+        help="Position in FEN notation. Defaults to the starting position.",
+    )
+    parser.add_argument(
+        "--depth", type=int, default=default(3),
+        help="Engine search depth. Defaults to 3.",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=default(15),
+        help="Engine time limit. Defaults to 15.",
+    )
+    parser.add_argument(
+        "--nodes", type=int, default=default(None),
+        help=(
+            "Engine node limit. Replaces the time limit for reproducible "
+            "moves."
+        ),
+    )
+    parser.add_argument(
+        "--seed", type=int, default=default(None),
+        help="Seed for the opening book choice.",
+    )
+    parser.add_argument(
+        "--no-book", action="store_false", dest="book", default=default(True),
+        help="Don't play moves from the opening book.",
+    )
+    parser.add_argument(
+        "--weights", type=str, default=default(None),
+        help="Load evaluation weights from a JSON file written by `tune`.",
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> int:
     """
     Parse command line arguments, initialize the game board, and enter the main
     game loop. The game loop alternates between the user and the AI making
@@ -45,12 +256,38 @@ def main() -> int:
     or stalemate occurs, and the final board state and result are printed.
     """
 
+    # One-shot searches skip building the full parser and setting up logging,
+    # since the job runners that call them pay the startup cost every time
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["bestmove"]:
+        parser = argparse.ArgumentParser(prog="osmanthus bestmove")
+        add_bestmove_arguments(parser)
+        return bestmove(parser.parse_args(argv[1:]))
+
     # Parse command line arguments
-    args = parser.parse_args()
+    args = build_parser().parse_args(argv)
 
     # Set logging level based on the `--debug` flag
+    import logging
+
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.ERROR)
 
+    # Load tuned evaluation weights if requested
+    if args.weights:
+        load_weights(args.weights)
+
+    # Dispatch to a subcommand if one was given
+    if args.command == "tune":
+        return tune(args)
+    if args.command == "serve":
+        return serve(args)
+    if args.command == "annotate":
+        return annotate(args)
+    if args.command == "datagen":
+        return datagen(args)
+    if args.command == "bestmove":
+        return bestmove(args)
+
     # Create the starting board, either from the FEN string or the default
     try:
         board = chess.Board(args.fen)
@@ -65,6 +302,12 @@ def main() -> int:
             input("Play as [w]hite or [b]lack? ").strip().lower()[:1],
         )
 
+    # Load the endgame tables before the game, so no move waits for them
+    endgame.load_tables()
+
+    # Carry the engine's search over from one move to the next
+    session = GameSession()
+
     # Main game loop
     try:
         while not board.is_game_over():
@@ -82,6 +325,8 @@ def main() -> int:
             else:
                 move = get_engine_move(
                     board, args.depth, args.limit, args.debug,
+                    book=args.book, nodes=args.nodes, seed=args.seed,
+                    session=session,
                 )
                 # print(f"{board.turn}'s move: {board.san(move)}")
 
@@ -99,6 +344,152 @@ def main() -> int:
     return 0
 
 
+def tune(args: argparse.Namespace) -> int:
+    """
+    Run the `tune` subcommand: fit the evaluation weights on labelled data and
+    write them to a JSON file that can be loaded with `--weights`.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The exit code.
+    """
+
+    # NumPy is only needed for tuning, so import it lazily
+    try:
+        from osmanthus.tune import tune as tune_weights
+    except ImportError:
+        print(
+            "Tuning requires NumPy: pip install osmanthus[tune]",
+            file=sys.stderr,
+        )
+        return 1
+
+    with args.data:
+        try:
+            final_loss = tune_weights(
+                args.data, args.output, epochs=args.epochs,
+                batch_size=args.batch_size, learning_rate=args.learning_rate,
+                k=args.k,
+            )
+        except ValueError as error:
+            print(f"Tuning failed: {error}", file=sys.stderr)
+            return 1
+    print(f"Wrote {args.output} (loss: {final_loss:.6f})")
+    return 0
+
+
+def serve(args: argparse.Namespace) -> int:  # pragma: no cover
+    """
+    Run the `serve` subcommand: answer analysis requests on a local port
+    until interrupted.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The exit code.
+    """
+
+    import asyncio
+
+    from osmanthus.server import AnalysisServer
+
+    server = AnalysisServer(
+        workers=args.workers, queue_size=args.queue_size,
+        default_deadline=args.deadline, weights=args.weights,
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def annotate(args: argparse.Namespace) -> int:
+    """
+    Run the `annotate` subcommand: stream the games of a PGN file and write
+    them back with evaluations and judgments of every move.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The exit code.
+    """
+
+    from osmanthus.annotate import annotate as annotate_games
+
+    # Games are flushed as they are written, so the files are left open
+    annotate_games(
+        args.pgn, args.output, depth=args.depth, limit=args.limit,
+        workers=args.workers,
+    )
+    return 0
+
+
+def datagen(args: argparse.Namespace) -> int:
+    """
+    Run the `datagen` subcommand: play self-play games in parallel and write
+    the searched positions to binary shards.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The exit code.
+    """
+
+    from osmanthus.datagen import generate
+
+    positions = generate(
+        args.output, args.games, workers=args.workers, nodes=args.nodes,
+        depth=args.depth, shard_size=args.shard_size, seed=args.seed,
+        opening_plies=args.opening_plies,
+    )
+    print(f"Wrote {positions} positions to {args.output}")
+    return 0
+
+
+def bestmove(args: argparse.Namespace) -> int:
+    """
+    Run the `bestmove` subcommand: search a single position and print the best
+    move in UCI notation.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The exit code.
+    """
+
+    try:
+        board = chess.Board(args.fen)
+    except ValueError as error:
+        print(f"Invalid FEN: {error}", file=sys.stderr)
+        return 2
+    if board.is_game_over():
+        print(f"The game is over: {board.result()}", file=sys.stderr)
+        return 1
+
+    # Load tuned evaluation weights if requested
+    if args.weights:
+        load_weights(args.weights)
+
+    # Generating missing endgame tables would dominate a one-shot search, so
+    # only the cached ones are used. Node-limited searches still load every
+    # table, so their result doesn't depend on the cache.
+    endgame.load_tables(generate=False)
+
+    move = get_engine_move(
+        board, args.depth, args.limit, book=args.book, nodes=args.nodes,
+        seed=args.seed,
+    )
+    print(move.uci())
+    return 0
+
+
 def print_fancy_board(board: chess.Board, user_color=chess.WHITE) -> None:
     """
     Print the current state of a chess board in a visually appealing way.
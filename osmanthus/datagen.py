@@ -0,0 +1,344 @@
+# This file implements self-play training data generation. Positions are
+# stored as packed, fixed-width 32-byte records in sharded files:
+#
+#   occupied        uint64     bitboard of occupied squares
+#   pieces          16 bytes   a 4-bit piece code per occupied square, in
+#                              square order (piece type, +8 for black)
+#   flags           uint8      bit 0: white to move, bits 1-4: castling
+#                              rights (white K, white Q, black K, black Q)
+#   ep_square       uint8      en passant square, or 64 if none
+#   score           int16      search score from white's view, clipped
+#   move            uint16     best move: from | to << 6 | promotion << 12
+#   result          int8       game result from white's view: 1, 0 or -1
+#   halfmove_clock  uint8      halfmove clock, capped at 255
+#
+# Each shard starts with a 16-byte header (magic, version, record size).
+from __future__ import annotations
+
+import os
+import random
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+from typing import TYPE_CHECKING
+
+import chess
+
+from osmanthus import endgame
+from osmanthus import engine
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MAGIC = b"OSMNDATA"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sII")
+RECORD = struct.Struct("<Q16sBBhHbB")
+
+# Scores beyond this (mates and table wins) are clipped
+MAX_SCORE = 32_000
+
+CASTLING_SQUARES = [chess.H1, chess.A1, chess.H8, chess.A8]
+
+
+def encode_position(
+    board: chess.Board, score: int, move: chess.Move, result: int,
+) -> bytes:
+    """
+    Packs a position and its labels into a fixed-width record.
+
+    Args:
+        board (chess.Board): The position.
+        score (int): The search score from white's point of view.
+        move (chess.Move): The best move found by the search.
+        result (int): The game result from white's point of view.
+
+    Returns:
+        bytes: The 32-byte record.
+    """
+
+    pieces = bytearray(16)
+    white = board.occupied_co[chess.WHITE]
+    for i, square in enumerate(chess.scan_forward(board.occupied)):
+        piece_type = board.piece_type_at(square) or 0
+        code = piece_type | (0 if white & chess.BB_SQUARES[square] else 8)
+        pieces[i >> 1] |= code << (4 * (i & 1))
+
+    flags = int(board.turn)
+    for bit, square in enumerate(CASTLING_SQUARES):
+        if board.castling_rights & chess.BB_SQUARES[square]:
+            flags |= 2 << bit
+
+    return RECORD.pack(
+        board.occupied, bytes(pieces), flags,
+        64 if board.ep_square is None else board.ep_square,
+        max(-MAX_SCORE, min(MAX_SCORE, score)),
+        move.from_square | move.to_square << 6 | (move.promotion or 0) << 12,
+        result, min(board.halfmove_clock, 255),
+    )
+
+
+def decode_position(record: bytes) -> tuple[chess.Board, int, chess.Move, int]:
+    """
+    Unpacks a record written by `encode_position`.
+
+    Args:
+        record (bytes): The 32-byte record.
+
+    Returns:
+        tuple[chess.Board, int, chess.Move, int]: The position, score, best
+        move and game result.
+    """
+
+    occupied, pieces, flags, ep_square, score, move, result, halfmove_clock = \
+        RECORD.unpack(record)
+
+    board = chess.Board.empty()
+    for i, square in enumerate(chess.scan_forward(occupied)):
+        code = pieces[i >> 1] >> (4 * (i & 1)) & 15
+        board.set_piece_at(square, chess.Piece(code & 7, not code & 8))
+
+    board.turn = bool(flags & 1)
+    board.castling_rights = 0
+    for bit, square in enumerate(CASTLING_SQUARES):
+        if flags & (2 << bit):
+            board.castling_rights |= chess.BB_SQUARES[square]
+    board.ep_square = None if ep_square == 64 else ep_square
+    board.halfmove_clock = halfmove_clock
+
+    best_move = chess.Move(move & 63, move >> 6 & 63, (move >> 12) or None)
+    return board, score, best_move, result
+
+
+def play_game(
+    rng: random.Random, nodes: int, depth: int, opening_plies: int,
+    max_plies: int = 400,
+) -> tuple[list[tuple[chess.Board, int, chess.Move]], int]:
+    """
+    Plays a self-play game from a random opening, searching every position
+    with a fixed node budget.
+
+    Args:
+        rng (random.Random): Source of randomness for the opening.
+        nodes (int): Node budget per move.
+        depth (int): Maximum search depth per move.
+        opening_plies (int): Maximum number of random book plies.
+        max_plies (int, optional): Game length after which it's a draw.
+
+    Returns:
+        tuple: The searched positions with their scores and best moves, and
+        the game result from white's point of view.
+    """
+
+    board = chess.Board()
+
+    # Randomized opening from the book, of random length
+    for _ in range(rng.randint(0, opening_plies)):
+        move = engine.get_opening_database_moves(board, rng.getrandbits(32))
+        if move is None:
+            break
+        board.push(move)
+
+    positions = []
+    while not board.is_game_over() and board.ply() < max_plies:
+        move = engine.get_engine_move(board, depth, book=False, nodes=nodes)
+        if (score := engine.DEBUG_INFO.get("score")) is not None:
+            positions.append((board.copy(stack=False), int(score), move))
+        board.push(move)
+
+    outcome = board.outcome()
+    if outcome is None or outcome.winner is None:
+        return positions, 0
+    return positions, 1 if outcome.winner else -1
+
+
+class ShardWriter:
+    """
+    Writes records to numbered shard files of at most `shard_size` records.
+    """
+
+    def __init__(self, directory: Path, prefix: str, shard_size: int) -> None:
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shards = 0
+        self.count = 0
+        self.file: BinaryIO | None = None
+
+    def write(self, record: bytes) -> None:
+        """
+        Appends a record, starting a new shard when the current one is full.
+        """
+
+        if self.file is None or self.count % self.shard_size == 0:
+            self.close()
+            path = self.directory / f"{self.prefix}-{self.shards:05d}.bin"
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.size))
+            self.shards += 1
+        self.file.write(record)
+        self.count += 1
+
+    def close(self) -> None:
+        """
+        Closes the current shard.
+        """
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def generate_worker(
+    worker: int, workers: int, games: int, output: str, nodes: int,
+    depth: int, shard_size: int, seed: int, opening_plies: int,
+) -> int:
+    """
+    Plays every `workers`-th game and writes its positions to the worker's
+    own shards.
+
+    Returns:
+        int: The number of positions written.
+    """
+
+    # Load the endgame tables before the first node-limited search needs them
+    endgame.load_tables()
+
+    writer = ShardWriter(Path(output), f"shard-w{worker:03d}", shard_size)
+    try:
+        for game in range(worker, games, workers):
+            # Every game has its own seed, so results don't depend on workers
+            rng = random.Random(f"{seed}-{game}")
+            positions, result = play_game(rng, nodes, depth, opening_plies)
+            for board, score, move in positions:
+                writer.write(encode_position(board, score, move, result))
+    finally:
+        writer.close()
+    return writer.count
+
+
+def generate(
+    output: str | Path, games: int, workers: int = 1, nodes: int = 5_000,
+    depth: int = 8, shard_size: int = 1_000_000, seed: int = 0,
+    opening_plies: int = 12,
+) -> int:
+    """
+    Generates labelled positions from self-play games played in parallel.
+
+    Args:
+        output (str | Path): Directory the shards are written to.
+        games (int): Number of games to play.
+        workers (int, optional): Worker processes; 1 plays in-process.
+        nodes (int, optional): Node budget per move.
+        depth (int, optional): Maximum search depth per move.
+        shard_size (int, optional): Maximum records per shard.
+        seed (int, optional): Seed for the random openings.
+        opening_plies (int, optional): Maximum number of random book plies.
+
+    Returns:
+        int: The number of positions written.
+    """
+
+    Path(output).mkdir(parents=True, exist_ok=True)
+    args = (games, str(output), nodes, depth, shard_size, seed, opening_plies)
+
+    if workers <= 1:
+        return generate_worker(0, 1, *args)
+
+    with ProcessPoolExecutor(workers) as pool:
+        counts = [
+            pool.submit(generate_worker, worker, workers, *args)
+            for worker in range(workers)
+        ]
+        return sum(count.result() for count in counts)
+
+
+def record_dtype() -> np.dtype:
+    """
+    Returns the NumPy structured dtype matching the record layout.
+
+    Returns:
+        np.dtype: The dtype of a record.
+    """
+
+    import numpy as np
+
+    return np.dtype([
+        ("occupied", "<u8"),
+        ("pieces", "u1", (16,)),
+        ("flags", "u1"),
+        ("ep_square", "u1"),
+        ("score", "<i2"),
+        ("move", "<u2"),
+        ("result", "i1"),
+        ("halfmove_clock", "u1"),
+    ])
+
+
+def read_records(path: str | Path) -> np.ndarray:
+    """
+    Memory-maps a shard as a NumPy structured array, without reading it.
+
+    Args:
+        path (str | Path): The shard file.
+
+    Returns:
+        np.ndarray: The records, with fields named as in `record_dtype`.
+    """
+
+    import numpy as np
+
+    with open(path, "rb") as file:
+        magic, version, record_size = HEADER.unpack(file.read(HEADER.size))
+    header = (magic, version, record_size)
+    if header != (MAGIC, FORMAT_VERSION, RECORD.size):
+        raise ValueError(
+            f"{path} is not a version {FORMAT_VERSION} data shard",
+        )
+
+    if os.path.getsize(path) == HEADER.size:
+        return np.empty(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode="r", offset=HEADER.size)
+
+
+def read_shards(directory: str | Path) -> list[np.ndarray]:
+    """
+    Memory-maps every shard in a directory.
+
+    Args:
+        directory (str | Path): The directory written by `generate`.
+
+    Returns:
+        list[np.ndarray]: The records of each shard, in name order.
+    """
+
+    paths = sorted(Path(directory).glob("shard-*.bin"))
+    return [read_records(path) for path in paths]
+
+
+def unpack_pieces(records: np.ndarray) -> np.ndarray:
+    """
+    Expands the packed piece codes of many records at once.
+
+    Args:
+        records (np.ndarray): Records from `read_records`.
+
+    Returns:
+        np.ndarray: (N, 64) uint8 piece codes by square (0 for empty squares,
+        the piece type for white pieces, the piece type + 8 for black pieces).
+    """
+
+    import numpy as np
+
+    shifts = np.arange(64, dtype=np.uint64)
+    bits = records["occupied"][:, None] >> shifts & np.uint64(1)
+    occupied = bits.astype(bool)
+    pieces = records["pieces"]
+    nibbles = np.stack([pieces & 15, pieces >> 4], axis=-1)
+    nibbles = nibbles.reshape(len(records), 32)
+
+    # The n-th occupied square holds the n-th piece code
+    order = np.clip(np.cumsum(occupied, axis=1) - 1, 0, 31)
+    codes = np.take_along_axis(nibbles, order, axis=1)
+    return np.where(occupied, codes, 0).astype(np.uint8)
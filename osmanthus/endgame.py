@@ -0,0 +1,388 @@
+# This file implements endgame tables for KQK, KRK and KPK, generated locally
+# by retrograde analysis the first time they are loaded. Generating a table
+# takes seconds, so tables are loaded up front with `load_tables`, and probing
+# only uses tables that are already loaded.
+# https://www.chessprogramming.org/Retrograde_Analysis
+from __future__ import annotations
+
+import os
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+
+import chess
+
+# Scores for positions found in the tables. Mates are scored by distance, so
+# the engine always makes progress; KPK wins prefer advancing the pawn.
+TABLEBASE_WIN = 100_000
+KNOWN_WIN = 50_000
+
+TABLE_VERSION = 1
+TABLE_SIZE = 2 * 64 * 64 * 64
+WHITE_TO_MOVE, BLACK_TO_MOVE = 0, 1
+
+# Loaded tables, by the piece type of the stronger side
+tables: dict[chess.PieceType, bytes] = {}
+
+
+def get_cache_dir() -> Path:
+    """
+    Returns the directory the generated tables are cached in. It can be set
+    with OSMANTHUS_CACHE_DIR, and otherwise follows the XDG convention.
+
+    Returns:
+        Path: The cache directory (not necessarily existing).
+    """
+
+    if cache_dir := os.environ.get("OSMANTHUS_CACHE_DIR"):
+        return Path(cache_dir)
+    xdg_cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg_cache) / "osmanthus"
+
+
+def get_table_path(piece_type: chess.PieceType) -> Path:
+    """
+    Returns the path a table is cached at.
+
+    Args:
+        piece_type (chess.PieceType): White's extra piece.
+
+    Returns:
+        Path: The cache file of the table (not necessarily existing).
+    """
+
+    name = f"k{chess.piece_symbol(piece_type)}k-v{TABLE_VERSION}.bin"
+    return get_cache_dir() / name
+
+
+def index(turn: int, white_king: int, black_king: int, square: int) -> int:
+    """
+    Returns the table index of a position, with white as the stronger side.
+
+    Args:
+        turn (int): WHITE_TO_MOVE or BLACK_TO_MOVE.
+        white_king (int): The white king's square.
+        black_king (int): The black king's square.
+        square (int): The square of white's other piece.
+
+    Returns:
+        int: The index into the table.
+    """
+
+    return turn << 18 | white_king << 12 | black_king << 6 | square
+
+
+def piece_attacks(
+    piece_type: chess.PieceType, square: int, occupied: int,
+) -> int:
+    """
+    Returns the squares attacked by a white queen, rook or pawn.
+
+    Args:
+        piece_type (chess.PieceType): The type of the piece.
+        square (int): The square of the piece.
+        occupied (int): Bitboard of the pieces that block sliding attacks.
+
+    Returns:
+        int: The bitboard of attacked squares.
+    """
+
+    if piece_type == chess.PAWN:
+        return chess.BB_PAWN_ATTACKS[chess.WHITE][square]
+
+    attacks = (
+        chess.BB_RANK_ATTACKS[square][occupied & chess.BB_RANK_MASKS[square]] |
+        chess.BB_FILE_ATTACKS[square][occupied & chess.BB_FILE_MASKS[square]]
+    )
+    if piece_type == chess.QUEEN:
+        diagonals = occupied & chess.BB_DIAG_MASKS[square]
+        attacks |= chess.BB_DIAG_ATTACKS[square][diagonals]
+    return attacks
+
+
+def is_legal(
+    piece_type: chess.PieceType, turn: int, white_king: int, black_king: int,
+    square: int,
+) -> bool:
+    """
+    Determines whether a position can occur in a game.
+
+    Returns:
+        bool: True if the position is legal, False otherwise.
+    """
+
+    if len({white_king, black_king, square}) < 3:
+        return False
+    if chess.BB_KING_ATTACKS[white_king] & chess.BB_SQUARES[black_king]:
+        return False
+    if piece_type == chess.PAWN and chess.square_rank(square) in (0, 7):
+        return False
+
+    # The side that just moved can't be left in check
+    occupied = chess.BB_SQUARES[white_king] | chess.BB_SQUARES[black_king]
+    attacks = piece_attacks(piece_type, square, occupied)
+    return turn == BLACK_TO_MOVE or not attacks & chess.BB_SQUARES[black_king]
+
+
+def black_moves(
+    piece_type: chess.PieceType, white_king: int, black_king: int, square: int,
+) -> tuple[list[int], bool]:
+    """
+    Generates the black king's legal moves.
+
+    Returns:
+        tuple[list[int], bool]: The squares the king can move to without
+        capturing, and whether it can capture white's piece.
+    """
+
+    # The black king doesn't block attacks along the line it moves on
+    occupied = chess.BB_SQUARES[white_king] | chess.BB_SQUARES[square]
+    guarded = chess.BB_KING_ATTACKS[white_king]
+    guarded |= piece_attacks(piece_type, square, occupied)
+
+    targets, capture = [], False
+    escapes = chess.BB_KING_ATTACKS[black_king] & ~guarded
+    for target in chess.scan_forward(escapes):
+        if target == square:
+            capture = True
+        else:
+            targets.append(target)
+    return targets, capture
+
+
+def white_unmoves(
+    piece_type: chess.PieceType, white_king: int, black_king: int, square: int,
+) -> Iterator[int]:
+    """
+    Generates the white-to-move positions that lead to the given black-to-move
+    position with one white move.
+
+    Yields:
+        int: The index of each predecessor position.
+    """
+
+    occupied = chess.BB_SQUARES[white_king] | chess.BB_SQUARES[black_king]
+
+    blocked = occupied | chess.BB_SQUARES[square]
+    moves = chess.BB_KING_ATTACKS[white_king] & ~blocked
+    for origin in chess.scan_forward(moves):
+        yield index(WHITE_TO_MOVE, origin, black_king, square)
+
+    if piece_type != chess.PAWN:
+        # Queen and rook moves are reversible
+        attacks = piece_attacks(piece_type, square, occupied)
+        for origin in chess.scan_forward(attacks & ~occupied):
+            yield index(WHITE_TO_MOVE, white_king, black_king, origin)
+        return
+
+    # Single and double pawn pushes
+    rank = chess.square_rank(square)
+    if rank >= 2 and not occupied & chess.BB_SQUARES[square - 8]:
+        yield index(WHITE_TO_MOVE, white_king, black_king, square - 8)
+        if rank == 3 and not occupied & chess.BB_SQUARES[square - 16]:
+            yield index(WHITE_TO_MOVE, white_king, black_king, square - 16)
+
+
+def generate_table(
+    piece_type: chess.PieceType, queen_table: bytes | None = None,
+) -> bytearray:
+    """
+    Solves king and queen, rook or pawn against king by retrograde analysis.
+    Starting from the mates (and, for pawns, the winning promotions), every
+    position is resolved once by walking the moves backwards. A black-to-move
+    position is lost once all of its moves lead to won positions.
+
+    Args:
+        piece_type (chess.PieceType): White's extra piece.
+        queen_table (bytes, optional): The KQK table, to score promotions.
+
+    Returns:
+        bytearray: For every index, 0 for a draw or illegal position, or 1 +
+        the number of plies until white mates (or, for pawns, promotes).
+    """
+
+    values = bytearray(TABLE_SIZE)
+    legal = bytearray(TABLE_SIZE)
+    remaining = bytearray(TABLE_SIZE)
+    queue: deque[int] = deque()
+
+    squares = range(8, 56) if piece_type == chess.PAWN else range(64)
+    for white_king in range(64):
+        for black_king in range(64):
+            for square in squares:
+                for turn in (WHITE_TO_MOVE, BLACK_TO_MOVE):
+                    if is_legal(
+                        piece_type, turn, white_king, black_king, square,
+                    ):
+                        legal[index(turn, white_king, black_king, square)] = 1
+
+    for i in range(TABLE_SIZE):
+        if not legal[i]:
+            continue
+        turn, white_king, black_king, square = (
+            i >> 18, i >> 12 & 63, i >> 6 & 63, i & 63,
+        )
+
+        if turn == BLACK_TO_MOVE:
+            # Count black's moves; capturing white's piece is a move that
+            # never loses, so such positions are never resolved as lost
+            targets, capture = black_moves(
+                piece_type, white_king, black_king, square,
+            )
+            remaining[i] = len(targets) + capture
+            if not remaining[i]:
+                king = chess.BB_SQUARES[black_king]
+                occupied = chess.BB_SQUARES[white_king] | king
+                if piece_attacks(piece_type, square, occupied) & king:
+                    values[i] = 1
+                    queue.append(i)
+
+        elif queen_table is not None and chess.square_rank(square) == 6:
+            # A pawn promoting to a queen that survives wins
+            promotion = square + 8
+            promoted = index(BLACK_TO_MOVE, white_king, black_king, promotion)
+            if promotion not in (white_king, black_king) and \
+                    queen_table[promoted]:
+                values[i] = 1
+                queue.append(i)
+
+    while queue:
+        i = queue.popleft()
+        turn, white_king, black_king, square = (
+            i >> 18, i >> 12 & 63, i >> 6 & 63, i & 63,
+        )
+        value = min(values[i] + 1, 255)
+
+        if turn == BLACK_TO_MOVE:
+            # Every position that can move into a lost position is won
+            for j in white_unmoves(piece_type, white_king, black_king, square):
+                if legal[j] and not values[j]:
+                    values[j] = value
+                    queue.append(j)
+        else:
+            # Black positions run out of moves that avoid won positions
+            origins = chess.BB_KING_ATTACKS[black_king]
+            for origin in chess.scan_forward(origins):
+                j = index(BLACK_TO_MOVE, white_king, origin, square)
+                if legal[j] and not values[j] and remaining[j]:
+                    remaining[j] -= 1
+                    if not remaining[j]:
+                        values[j] = value
+                        queue.append(j)
+
+    return values
+
+
+def load_table(piece_type: chess.PieceType) -> bytes:
+    """
+    Returns the table for king and the given piece against king, loading it
+    from the cache directory or generating (and caching) it on first use.
+    The KPK table is stored as a bitbase of won positions.
+
+    Args:
+        piece_type (chess.PieceType): White's extra piece.
+
+    Returns:
+        bytes: The table, indexed by `index`.
+    """
+
+    if (table := tables.get(piece_type)) is not None:
+        return table
+
+    is_bitbase = piece_type == chess.PAWN
+    size = TABLE_SIZE // 8 if is_bitbase else TABLE_SIZE
+    path = get_table_path(piece_type)
+
+    try:
+        table = path.read_bytes()
+    except OSError:
+        table = b""
+
+    if len(table) != size:
+        queen_table = load_table(chess.QUEEN) if is_bitbase else None
+        values = generate_table(piece_type, queen_table)
+        if is_bitbase:
+            bits = bytearray(size)
+            for i in range(TABLE_SIZE):
+                if values[i]:
+                    bits[i >> 3] |= 1 << (i & 7)
+            values = bits
+        table = bytes(values)
+
+        # Caching is best-effort; the table is still used if it fails
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_suffix(f".{os.getpid()}.tmp")
+            temporary.write_bytes(table)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+    tables[piece_type] = table
+    return table
+
+
+def load_tables(generate: bool = True) -> None:
+    """
+    Loads (or generates) every table, so that no search has to wait for one.
+
+    Args:
+        generate (bool, optional): If set to False, only load the tables that
+        are already cached, which is fast enough for short-lived processes.
+
+    Returns:
+        None.
+    """
+
+    for piece_type in (chess.QUEEN, chess.ROOK, chess.PAWN):
+        if generate or get_table_path(piece_type).exists():
+            load_table(piece_type)
+
+
+def probe(board: chess.Board) -> int | None:
+    """
+    Looks up the exact score of a king and queen, rook or pawn against king
+    position. Tables that aren't loaded yet are never generated here, since
+    that would stall the search.
+
+    Args:
+        board (chess.Board): The current state of the chess board.
+
+    Returns:
+        int | None: The score from white's point of view, or None if the
+        position isn't covered by the loaded tables.
+    """
+
+    if chess.popcount(board.occupied) != 3:
+        return None
+
+    # Find the stronger side and its extra piece
+    color = chess.popcount(board.occupied_co[chess.WHITE]) == 2
+    square = chess.lsb(board.occupied_co[color] & ~board.kings)
+    piece_type = board.piece_type_at(square)
+    if piece_type not in (chess.QUEEN, chess.ROOK, chess.PAWN):
+        return None
+
+    # Look positions up with the stronger side as white
+    white_king, black_king = board.king(color), board.king(not color)
+    if white_king is None or black_king is None:
+        return None
+    if not color:
+        white_king, black_king, square = (
+            white_king ^ 56, black_king ^ 56, square ^ 56,
+        )
+    turn = WHITE_TO_MOVE if board.turn == color else BLACK_TO_MOVE
+    i = index(turn, white_king, black_king, square)
+
+    if (table := tables.get(piece_type)) is None:
+        return None
+    if piece_type == chess.PAWN:
+        if not table[i >> 3] >> (i & 7) & 1:
+            return 0
+        score = KNOWN_WIN + 10 * chess.square_rank(square)
+    else:
+        if not table[i]:
+            return 0
+        score = TABLEBASE_WIN - (table[i] - 1)
+
+    return score if color else -score
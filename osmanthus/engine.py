@@ -1,14 +1,23 @@
 # flake8: noqa
 from __future__ import annotations
 
+import random
 import sys
+import threading
 import time
 from collections import defaultdict
+from collections.abc import AsyncIterator
+from collections.abc import Callable
+from collections.abc import Collection
+from dataclasses import dataclass
+from dataclasses import field
 from pathlib import Path
 
 import chess
 from chess import polyglot
 
+from osmanthus import endgame
+from osmanthus.evaluate import CACHE_STATS
 from osmanthus.evaluate import evaluate_board
 from osmanthus.evaluate import is_favorable_move
 # from functools import cache
@@ -17,77 +26,330 @@ from osmanthus.evaluate import is_favorable_move
 
 # chess.Board.__hash__ = chess.polyglot.zobrist_hash
 
+BOOK_PATH = Path(__file__).resolve().parent / "performance.bin"
 DEBUG_INFO: dict[str, float] = {}
-TIMEOUT_SECONDS: int
-QUIESCENCE_SEARCH_DEPTH: int = 20
+TIMEOUT_SECONDS: float
+NODE_LIMIT: int | None = None
+# Mates are scored as sys.maxsize less their distance from the root in plies,
+# so the engine prefers the quickest mate; scores beyond MATE_THRESHOLD are mates
+MATE_THRESHOLD = sys.maxsize - 1_000
+
+# Nodes each quiescence search may visit before scoring positions statically,
+# and whether it tries quiet checks at its first ply
+QUIESCENCE_NODE_BUDGET: int = 2_000
+QUIESCENCE_CHECKS: bool = True
 
 best_move: chess.Move
 global_best_move: chess.Move
 DEPTH = 0
+ROOT_PLY = 0
+ROOT_MOVES: list[chess.Move] | None = None
+SEARCH_MOVES: Collection[chess.Move] | None = None
+quiescence_node_limit: float = 0
 IS_TIMEOUT = False
 move_scores: dict = defaultdict(dict)
+principal_variations: dict[int, list[chess.Move]] = {}
+principal_variation: list[chess.Move] = []
 start_time: float
+stop_event: threading.Event | None = None
+SEARCH_LOCK = threading.RLock()
+book_reader: polyglot.MemoryMappedReader | None = None
+
 
+@dataclass
+class GameSession:
+    """
+    Search state carried from one move of a game to the next. Pass the same
+    session to every search of a game: when the position is on the principal
+    variation of the previous search (after the expected reply, or after the
+    engine's own move in self-play), the search resumes one ply short of the
+    previous depth instead of starting over.
+
+    Attributes:
+        move_scores (dict): The game's own move-ordering table.
+        principal_variation (list[chess.Move]): The line expected by the
+        previous search, from the position it searched.
+        fens (list[str]): The positions one and two plies along that line.
+        depth (int): The depth the previous search completed.
+    """
 
-def get_engine_move(board: chess.Board, depth=3, limit=15, debug=False) -> chess.Move:
+    move_scores: dict = field(default_factory=lambda: defaultdict(dict))
+    principal_variation: list[chess.Move] = field(default_factory=list)
+    fens: list[str] = field(default_factory=list)
+    depth: int = 0
+
+    def resume(self, board: chess.Board) -> tuple[int, list[chess.Move]]:
+        """
+        Prepares the session for a search of the given position.
+
+        Args:
+            board (chess.Board): The position about to be searched.
+
+        Returns:
+            tuple[int, list[chess.Move]]: The depth to start iterative
+            deepening at, and the legal moves ordered by the previous search.
+        """
+
+        # Positions from earlier moves of the game can't be reached again
+        for fen in list(self.move_scores):
+            if int(fen.rsplit(" ", 1)[1]) < board.fullmove_number:
+                del self.move_scores[fen]
+
+        fen = board.fen()
+        root_moves = order_moves(board, self.move_scores.get(fen, {}))
+        if fen not in self.fens:
+            return 0, root_moves
+
+        # Try the expected continuation first
+        plies = self.fens.index(fen) + 1
+        if len(self.principal_variation) > plies:
+            expected = self.principal_variation[plies]
+            if expected in root_moves:
+                root_moves.remove(expected)
+                root_moves.insert(0, expected)
+        return max(0, self.depth - 1), root_moves
+
+    def update(self, board: chess.Board, depth: int) -> None:
+        """
+        Records the result of a search of the given position.
+
+        Args:
+            board (chess.Board): The position that was searched.
+            depth (int): The depth the search completed, or 0 if it played
+            a book move.
+        """
+
+        self.depth = depth
+        self.principal_variation = list(principal_variation) if depth else []
+        self.fens = []
+        line = board.copy(stack=False)
+        for move in self.principal_variation[:2]:
+            line.push(move)
+            self.fens.append(line.fen())
+
+
+def get_engine_move(
+    board: chess.Board, depth=3, limit=15, debug=False, book=True,
+    nodes: int | None = None, seed: int | None = None,
+    stop: threading.Event | None = None,
+    on_iteration: Callable[[int, chess.Move, int], None] | None = None,
+    session: GameSession | None = None,
+    search_moves: Collection[chess.Move] | None = None,
+) -> chess.Move:
     """
     Given the current state of the board, returns the best move for the engine.
 
     Args:
         board (chess.Board): The current state of the chess board.
         depth (int, optional): The maximum depth to search the game tree.
-        limit (int, optional): The maximum time to search the game tree.
+        limit (float, optional): The maximum time in seconds to search the
+        game tree.
         debug (bool, optional): If set to True, prints debug information.
+        book (bool, optional): If set to False, always search instead of
+        playing from the opening book.
+        nodes (int, optional): If set, stop after searching this many nodes
+        instead of after `limit` seconds. Node-limited searches start from an
+        empty move-ordering table and always use the endgame tables
+        (generating them if they aren't cached yet), so the same input always
+        gives the same move and node count.
+        seed (int, optional): Seed for choosing among opening book moves.
+        stop (threading.Event, optional): Stops the search as soon as it is
+        set, returning the best move of the last completed iteration.
+        on_iteration (Callable, optional): Called with the depth, best move
+        and score after each completed iteration.
+        session (GameSession, optional): The game the position belongs to.
+        The search then uses the game's move-ordering table and resumes from
+        the previous search where it can. Node-limited searches ignore the
+        session, so they stay reproducible per position.
+        search_moves (Collection[chess.Move], optional): If set, only these
+        root moves are searched, and neither the opening book nor the session
+        is used.
 
     Returns:
         chess.Move: The best move for the current player.
     """
 
+    global move_scores
     global start_time
     global TIMEOUT_SECONDS
+    global NODE_LIMIT
+    global SEARCH_MOVES
+    global stop_event
+
+    # Only one search can run at a time, since the search state is global
+    with SEARCH_LOCK:
+        stop_event = stop
+        TIMEOUT_SECONDS = limit
+        NODE_LIMIT = nodes
+        SEARCH_MOVES = search_moves
+
+        # Don't let earlier searches, even of the same game, influence a
+        # reproducible search. Otherwise a game session brings its own table
+        # and the previous search.
+        if nodes is not None or search_moves is not None:
+            session = None
+        start_depth, root_moves = 0, None
+        shared_scores = move_scores
+        if session is not None:
+            move_scores = session.move_scores
+            start_depth, root_moves = session.resume(board)
+        elif nodes is not None:
+            move_scores.clear()
+
+        # Restricted searches start from the allowed moves only
+        if search_moves is not None:
+            book = False
+            root_moves = [
+                move for move in order_moves(board, move_scores.get(board.fen(), {}))
+                if move in search_moves
+            ]
+
+        # Make sure the endgame tables are ready before the clock starts when
+        # they are close, and always for node-limited searches, whose result
+        # must not depend on which tables happen to be loaded. Other searches
+        # only probe the tables loaded up front with `endgame.load_tables`.
+        if nodes is not None or chess.popcount(board.occupied) <= 4:
+            endgame.load_tables()
+
+        # Mate distances from the tables are exact, so one ply is enough
+        if (score := endgame.probe(board)) is not None and abs(score) >= endgame.TABLEBASE_WIN - 255:
+            depth = 1
+
+        # Clear debug info and set up a timer
+        DEBUG_INFO.clear()
+        DEBUG_INFO["nodes"] = 0
+        CACHE_STATS.update(dict.fromkeys(CACHE_STATS, 0))
+        start_time = time.time()
+
+        # Call the minimax algorithm to get the best move
+        try:
+            if not (book and (move := get_opening_database_moves(board, seed))):
+                move = iterative_deepening(
+                    board, max(1, depth), debug, on_iteration, start_depth,
+                    root_moves,
+                )
+            if session is not None:
+                session.update(board, int(DEBUG_INFO.get("depth", 0)))
+        finally:
+            move_scores = shared_scores
+
+        # Calculate the time taken and cache hit rates, and print debug info
+        DEBUG_INFO["time"] = time.time() - start_time
+        for cache in ("eval", "pawn"):
+            if probes := CACHE_STATS[f"{cache}_probes"]:
+                DEBUG_INFO[f"{cache}_hit_rate"] = CACHE_STATS[f"{cache}_hits"] / probes
+        if debug:  # pragma: no cover
+            print(f"debug info: {DEBUG_INFO}")
+        return move
+
+
+async def get_engine_move_async(
+    board: chess.Board, depth=3, limit=15, book=True,
+    nodes: int | None = None, seed: int | None = None,
+    stop: threading.Event | None = None,
+) -> AsyncIterator[tuple[int, chess.Move, int | None]]:
+    """
+    Searches for the best move in a worker thread without blocking the event
+    loop, yielding an update after each iterative-deepening iteration. The
+    last update holds the move to play; a book move, or the fallback when no
+    iteration completes, is yielded with depth 0 and no score.
+
+    Setting `stop`, closing the iterator (`await updates.aclose()`) or
+    cancelling the task that iterates it stops the search at its next node.
+    Searches share the engine's global state, so concurrent searches run one
+    after another.
+
+        updates = get_engine_move_async(board)
+        async for depth, move, score in updates:
+            print(depth, move, score)
+
+    Args:
+        board (chess.Board): The current state of the chess board.
+        depth (int, optional): The maximum depth to search the game tree.
+        limit (int, optional): The maximum time to search the game tree.
+        book (bool, optional): If set to False, always search instead of
+        playing from the opening book.
+        nodes (int, optional): If set, stop after searching this many nodes.
+        seed (int, optional): Seed for choosing among opening book moves.
+        stop (threading.Event, optional): Stops the search when set.
+
+    Yields:
+        tuple[int, chess.Move, int | None]: The depth, best move and score.
+    """
 
-    TIMEOUT_SECONDS = max(1, limit)
+    # asyncio is slow to import, and only needed by async callers
+    import asyncio
 
-    # Clear debug info and set up a timer
-    DEBUG_INFO["nodes"] = 0
-    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    updates: asyncio.Queue[tuple[int, chess.Move, int | None]] = asyncio.Queue()
+    stop = stop or threading.Event()
 
-    # Call the minimax algorithm to get the best move
-    if not (move := get_opening_database_moves(board)):
-        move = iterative_deepening(board, max(1, depth), debug)
+    # The search pushes and pops moves, so it gets its own copy of the board
+    board = board.copy()
 
-    # Calculate the time taken and print debug info if requested
-    DEBUG_INFO["time"] = time.time() - start_time
-    if debug:  # pragma: no cover
-        print(f"debug info: {DEBUG_INFO}")
-    return move
+    def on_iteration(depth: int, move: chess.Move, score: int) -> None:
+        loop.call_soon_threadsafe(updates.put_nowait, (depth, move, score))
 
+    search = loop.run_in_executor(
+        None, lambda: get_engine_move(
+            board, depth, limit, book=book, nodes=nodes, seed=seed,
+            stop=stop, on_iteration=on_iteration,
+        ),
+    )
 
-def get_opening_database_moves(board: chess.Board) -> chess.Move | None:
+    try:
+        last_move = None
+        while not search.done() or not updates.empty():
+            update = asyncio.ensure_future(updates.get())
+            waiting: set[asyncio.Future] = {update, search}
+            await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if not update.done():
+                update.cancel()
+                continue
+            last_move = update.result()[1]
+            yield update.result()
+
+        # Report the move if no iteration produced it
+        if (move := await search) != last_move:
+            yield 0, move, None
+    finally:
+        stop.set()
+
+
+def get_opening_database_moves(
+    board: chess.Board, seed: int | None = None,
+) -> chess.Move | None:
     """
     Get a move from the opening book using Polyglot library.
 
     Args:
         board (chess.Board): The current state of the chess board.
+        seed (int, optional): Seed for the weighted random choice of move.
 
     Returns:
         chess.Move | None: A move from the opening book, if available.
     """
 
-    dir_path = Path(__file__).resolve().parent
-    book_path = dir_path / "performance.bin"
+    global book_reader
 
-    # Open the opening book file with Polyglot
-    with polyglot.open_reader(book_path) as reader:
-        try:
-            # Get a random move from the opening book
-            return reader.weighted_choice(board).move
-        except IndexError:
-            # Return None if no moves are available in the opening book
-            return None
+    # Open the opening book file with Polyglot once and keep it mapped
+    if book_reader is None:
+        book_reader = polyglot.open_reader(BOOK_PATH)
 
+    try:
+        # Get a random move from the opening book
+        rng = random.Random(seed) if seed is not None else None
+        return book_reader.weighted_choice(board, random=rng).move
+    except IndexError:
+        # Return None if no moves are available in the opening book
+        return None
 
-def iterative_deepening(board: chess.Board, depth: int, debug: bool) -> chess.Move:
+
+def iterative_deepening(
+    board: chess.Board, depth: int, debug: bool,
+    on_iteration: Callable[[int, chess.Move, int], None] | None = None,
+    start_depth: int = 0, root_moves: list[chess.Move] | None = None,
+) -> chess.Move:
     """
     This function performs an iterative deepening search on the given chess
     board using the minimax algorithm.
@@ -96,6 +358,11 @@ def iterative_deepening(board: chess.Board, depth: int, debug: bool) -> chess.Mo
         board (chess.Board): The current state of the chess board.
         depth (int): The maximum depth to search to.
         debug (bool): If True, print debug information during the search.
+        on_iteration (Callable, optional): Called with the depth, best move
+        and score after each completed iteration.
+        start_depth (int, optional): The depth of the first iteration.
+        root_moves (list[chess.Move], optional): The order to search the
+        root moves in during the first iteration.
 
     Returns:
         chess.Move: The best move found after the search.
@@ -103,25 +370,42 @@ def iterative_deepening(board: chess.Board, depth: int, debug: bool) -> chess.Mo
 
     # Initialize global variables
     global DEPTH
+    global ROOT_PLY
+    global ROOT_MOVES
     global IS_TIMEOUT
     global global_best_move
+    global principal_variation
 
     IS_TIMEOUT = False
+    ROOT_PLY = board.ply()
+    ROOT_MOVES = root_moves
+    principal_variation = []
     current_score = 0
 
-    # Loop through depths from 0 up to the maximum depth
-    for DEPTH in range(depth + 1):
+    # Fall back to the first legal move if no iteration completes
+    global_best_move = next(iter(root_moves or board.legal_moves), chess.Move.null())
+
+    # Loop through depths from the starting depth up to the maximum depth
+    for DEPTH in range(min(start_depth, depth), depth + 1):
 
-        # Exit loop if timeout or maximum score has been reached
-        if IS_TIMEOUT or current_score in {-sys.maxsize, sys.maxsize}:
+        # Exit loop if timeout or maximum score has been reached. The depth 0
+        # search can find mates in its checks, but doesn't choose a move.
+        if IS_TIMEOUT or (DEPTH > 1 and abs(current_score) >= MATE_THRESHOLD):
             break
 
-        # Run minimax algorithm with the current depth
+        # Run minimax algorithm with the current depth. Later iterations
+        # order the root moves by the scores of the previous one.
         current_score = minimax(board, -sys.maxsize, sys.maxsize, DEPTH)
+        ROOT_MOVES = None
 
         # Update best move if a new one is found
         if DEPTH and not IS_TIMEOUT:
             global_best_move = best_move
+            principal_variation = principal_variations.get(0) or [best_move]
+            DEBUG_INFO["depth"] = DEPTH
+            DEBUG_INFO["score"] = current_score
+            if on_iteration is not None:
+                on_iteration(DEPTH, global_best_move, current_score)
 
             # Print debug information if requested
             if debug:  # pragma: no cover
@@ -136,9 +420,61 @@ def iterative_deepening(board: chess.Board, depth: int, debug: bool) -> chess.Mo
 # @cache
 
 
+def order_moves(board: chess.Board, board_scores: dict) -> list[chess.Move]:
+    """
+    Orders the legal moves of a position, best first by their recorded scores.
+
+    Args:
+        board (chess.Board): The current chess board state.
+        board_scores (dict): The recorded score of each move, if any.
+
+    Returns:
+        list[chess.Move]: The legal moves, best first.
+    """
+
+    # The sort is stable, so ties keep python-chess's move generation order
+    # and the search is repeatable.
+    return sorted(
+        board.legal_moves, key=lambda move: board_scores.get(move, 0) *
+        (-1)**board.turn,
+    )
+
+
+def mate_score(board: chess.Board) -> int:
+    """
+    Scores the side to move being checkmated, from white's point of view.
+
+    Args:
+        board (chess.Board): A position where the side to move is mated.
+
+    Returns:
+        int: The mate score, smaller in magnitude the further from the root.
+    """
+
+    return (sys.maxsize - (board.ply() - ROOT_PLY)) * (-1)**board.turn
+
+
+def is_search_stopped() -> bool:
+    """
+    Determines whether the current search has to stop: when its stop event is
+    set, or when it exceeds its node limit (or, without one, its time limit).
+
+    Returns:
+        bool: True if the search has to stop, False otherwise.
+    """
+
+    if stop_event is not None and stop_event.is_set():
+        return True
+    if NODE_LIMIT is not None:
+        return DEBUG_INFO["nodes"] > NODE_LIMIT
+    return time.time() - start_time > TIMEOUT_SECONDS
+
+
 def minimax(board: chess.Board, alpha: int, beta: int, depth: int) -> int:
     """
     Compute the best move using the minimax algorithm with alpha-beta pruning.
+    Moves that give check are searched one ply deeper. Since every other ply
+    still loses one, checking sequences always end.
 
     Args:
         board (chess.Board): The current chess board state.
@@ -152,52 +488,70 @@ def minimax(board: chess.Board, alpha: int, beta: int, depth: int) -> int:
 
     global best_move
     global IS_TIMEOUT
+    global quiescence_node_limit
 
     DEBUG_INFO["nodes"] += 1
 
-    # Check if the time limit has been reached
-    if time.time() - start_time > TIMEOUT_SECONDS:
+    # Extensions change the depth, so the root is found by its ply
+    ply = board.ply() - ROOT_PLY
+    is_root = not ply
+
+    # The principal variation from this node, set as moves improve the score
+    principal_variations[ply] = []
+
+    # Check if the search was stopped or its limit has been reached
+    if is_search_stopped():
         IS_TIMEOUT = True
         return alpha if board.turn else beta
 
-    # Check for checkmate or stalemate
+    # Check for checkmate, or a draw by stalemate, material or repetition
     if board.is_game_over():
-        return sys.maxsize * (-1)**board.turn * (not board.is_stalemate())
+        return mate_score(board) * board.is_checkmate()
+
+    # Look up exact scores in the endgame tables below the root
+    if not is_root and (score := endgame.probe(board)) is not None:
+        return score
 
     # Apply quiescence search if the maximum depth is reached
     if depth < 1:
+        quiescence_node_limit = DEBUG_INFO["nodes"] + QUIESCENCE_NODE_BUDGET
         return quiescence_search(board, alpha, beta, 1)
 
     # Initialize the score based on the current player's color
     score = alpha if board.turn else beta
 
-    # Get the scores for each legal move for the current board position
-    board_scores = move_scores.get(board.fen(), {})
+    # Get the scores recorded for each legal move of the current position
+    board_scores = move_scores[board.fen()]
 
-    # Sort the legal moves based on the scores
-    moves = sorted(
-        board.legal_moves, key=lambda move: board_scores.get(move, 0) *
-        (-1)**board.turn,
-    )
+    # Sort the legal moves based on the scores, unless the root moves were
+    # already ordered by a previous search
+    if is_root and ROOT_MOVES is not None:
+        moves = ROOT_MOVES
+    else:
+        moves = order_moves(board, board_scores)
+        if is_root and SEARCH_MOVES is not None:
+            moves = [move for move in moves if move in SEARCH_MOVES]
 
     # Loop through each legal move and update the score if necessary
     for move in moves:
         board.push(move)
 
-        # Recursively call minimax for the next depth
+        # Recursively call minimax for the next depth, extending checks
+        next_depth = depth - 1 + board.is_check()
         if board.turn:
-            move_score = minimax(board, alpha, score, depth - 1)
+            move_score = minimax(board, alpha, score, next_depth)
         else:
-            move_score = minimax(board, score, beta, depth - 1)
+            move_score = minimax(board, score, beta, next_depth)
 
         # Update the move_scores dictionary with the new move score
-        move_scores[board.fen()][move] = move_score
         board.pop()
+        board_scores[move] = move_score
 
         # Update the score and best_move if necessary, and perform alpha-beta pruning
         if (board.turn and move_score > score) or ((not board.turn) and move_score < score):
             score = move_score
-            if depth == DEPTH:
+            principal_variations[ply] = [move, *principal_variations.get(ply + 1, [])]
+            if is_root:
                 best_move = move
             if (board.turn and score >= beta) or ((not board.turn) and score <= alpha):
                 break
@@ -209,12 +563,16 @@ def minimax(board: chess.Board, alpha: int, beta: int, depth: int) -> int:
 def quiescence_search(board: chess.Board, alpha: int, beta: int, depth: int) -> int:
     """
     Quiescence Search algorithm used for alpha-beta pruning of chess board.
+    Outside of check, the side to move may stand pat on the static evaluation
+    or try favorable captures and promotions (and, at the first ply, quiet
+    checks). In check, every evasion is searched. Once the search from the
+    current leaf exceeds its node budget, positions are scored statically.
 
     Args:
         board (chess.Board): current chess board state
         alpha (int): best score of maximizer
         beta (int): best score of minimizer
-        depth (int): current depth in search tree
+        depth (int): current depth in search tree, starting at 1
 
     Returns:
         int: evaluated score of the current chess board
@@ -223,24 +581,46 @@ def quiescence_search(board: chess.Board, alpha: int, beta: int, depth: int) ->
     # increment node counter for debugging purposes
     DEBUG_INFO["nodes"] += 1
 
-    # if maximum depth is reached or no favorable moves available, return evaluated score
-    if depth == QUIESCENCE_SEARCH_DEPTH or not board.legal_moves:
-        return evaluate_board(board)
-
-    # determine favorable moves
-    favorable_moves = [
-        move for move in board.legal_moves if is_favorable_move(board, move)
-    ]
-
-    # if no favorable moves available, return evaluated score
-    if not favorable_moves:
-        return evaluate_board(board)
-
-    # initialize score based on which player's turn it is
-    score = alpha if board.turn else beta
-
-    # loop through favorable moves
-    for move in favorable_moves:
+    # return the exact score if the position is in the endgame tables
+    if (score := endgame.probe(board)) is not None:
+        return score
+
+    # checkmate and stalemate are scored as in minimax
+    if not any(board.generate_legal_moves()):
+        return mate_score(board) * board.is_check()
+
+    out_of_budget = DEBUG_INFO["nodes"] > quiescence_node_limit
+
+    if board.is_check():
+        # there is no standing pat in check, so search every evasion
+        if out_of_budget:
+            return evaluate_board(board)
+        score = alpha if board.turn else beta
+        moves = list(board.legal_moves)
+    else:
+        # stand pat: the side to move doesn't have to capture
+        stand_pat = evaluate_board(board)
+        if out_of_budget:
+            return stand_pat
+        if board.turn:
+            if stand_pat >= beta:
+                return stand_pat
+            score = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            score = min(beta, stand_pat)
+
+        # determine favorable moves, and quiet checks at the first ply
+        checks = depth == 1 and QUIESCENCE_CHECKS
+        moves = [
+            move for move in board.legal_moves
+            if is_favorable_move(board, move) or
+            (checks and not board.is_capture(move) and board.gives_check(move))
+        ]
+
+    # loop through the moves
+    for move in moves:
         # make the move and recursively evaluate the resulting board
         board.push(move)
         if board.turn:
@@ -2,6 +2,9 @@
 # https://www.chessprogramming.org/Simplified_Evaluation_Function
 from __future__ import annotations
 
+import os
+from pathlib import Path
+
 import chess
 
 PIECE_VALUE = {
@@ -92,6 +95,106 @@ KING_ENDGAME = [
     -50, -30, -30, -30, -30, -30, -30, -50,
 ]
 
+# Pawn-structure terms, in centipawns per pawn. Passed pawn bonuses are
+# indexed by rank, counted from the pawn's own side of the board.
+PAWN_STRUCTURE = {
+    "doubled": -10,
+    "isolated": -10,
+}
+PASSED_PAWN = [0, 5, 10, 20, 35, 60, 100, 0]
+
+# Files next to each file, for finding isolated pawns
+ADJACENT_FILES = [
+    (chess.BB_FILES[file - 1] if file > 0 else 0) |
+    (chess.BB_FILES[file + 1] if file < 7 else 0)
+    for file in range(8)
+]
+
+# Squares that must be free of enemy pawns for a pawn to be passed
+PASSED_PAWN_MASKS = {
+    color: [
+        (chess.BB_FILES[chess.square_file(square)] |
+         ADJACENT_FILES[chess.square_file(square)]) &
+        sum(
+            chess.BB_RANKS[rank] for rank in range(8)
+            if (rank > chess.square_rank(square) if color else
+                rank < chess.square_rank(square))
+        )
+        for square in chess.SQUARES
+    ]
+    for color in chess.COLORS
+}
+
+# Direct-mapped caches for whole evaluations and pawn-structure scores. Each
+# slot holds a (key, score) pair; a colliding entry simply replaces it.
+EVAL_CACHE_SIZE = 1 << 16
+PAWN_CACHE_SIZE = 1 << 14
+eval_cache: list[tuple[tuple[int, ...], int] | None] = [None] * EVAL_CACHE_SIZE
+pawn_cache: list[tuple[tuple[int, int], int] | None] = [None] * PAWN_CACHE_SIZE
+CACHE_STATS: dict[str, int] = dict.fromkeys(
+    ("eval_probes", "eval_hits", "pawn_probes", "pawn_hits"), 0,
+)
+
+
+def clear_caches() -> None:
+    """
+    Empties the evaluation and pawn caches, e.g. after the weights change.
+
+    Returns:
+        None.
+    """
+
+    eval_cache[:] = [None] * EVAL_CACHE_SIZE
+    pawn_cache[:] = [None] * PAWN_CACHE_SIZE
+
+
+def load_weights(path: str | Path) -> None:
+    """
+    Loads tuned evaluation weights (as written by `osmanthus tune`) from a JSON
+    file. The tables are updated in place, so every module holding a reference
+    to them picks up the new values. Entries missing from the file keep their
+    current value.
+
+    Args:
+        path (str | Path): Path to the JSON weights file.
+
+    Returns:
+        None.
+    """
+
+    import json
+
+    with open(path, encoding="utf-8") as file:
+        weights = json.load(file)
+
+    # Update the material values, keyed by piece name (e.g. "knight")
+    for name, value in weights.get("piece_value", {}).items():
+        PIECE_VALUE[chess.PIECE_NAMES.index(name)] = int(value)
+
+    # Update the piece-square tables, keeping the list objects intact
+    for name, table in weights.get("pst", {}).items():
+        if len(table) != 64:
+            raise ValueError(f"PST for {name} must have 64 entries")
+        PST[chess.PIECE_NAMES.index(name)][:] = [int(v) for v in table]
+
+    if (table := weights.get("king_endgame")) is not None:
+        if len(table) != 64:
+            raise ValueError("KING_ENDGAME must have 64 entries")
+        KING_ENDGAME[:] = [int(v) for v in table]
+
+    # Update the pawn-structure terms
+    pawn_structure = weights.get("pawn_structure", {})
+    for name in PAWN_STRUCTURE:
+        if name in pawn_structure:
+            PAWN_STRUCTURE[name] = int(pawn_structure[name])
+    if (table := pawn_structure.get("passed")) is not None:
+        if len(table) != 8:
+            raise ValueError("PASSED_PAWN must have 8 entries")
+        PASSED_PAWN[:] = [int(v) for v in table]
+
+    # Cached scores were computed with the old weights
+    clear_caches()
+
 
 def is_favorable_move(board: chess.Board, move: chess.Move) -> bool:
     """
@@ -153,10 +256,83 @@ def get_pst(piece: chess.Piece, square: chess.Square, endgame: bool) -> int:
     return mapping[square]
 
 
+def count_pawn_structure(
+    pawns: chess.Bitboard, enemy_pawns: chess.Bitboard, color: chess.Color,
+) -> tuple[int, int, list[int]]:
+    """
+    Counts the doubled, isolated and passed pawns of one side.
+
+    Args:
+        pawns (chess.Bitboard): The pawns of the side to count.
+        enemy_pawns (chess.Bitboard): The pawns of the other side.
+        color (chess.Color): The color of the side to count.
+
+    Returns:
+        tuple[int, int, list[int]]: The number of doubled pawns (beyond the
+        first on each file), isolated pawns, and passed pawns per rank counted
+        from the side's own back rank.
+    """
+
+    doubled, isolated = 0, 0
+    for file in range(8):
+        if count := chess.popcount(pawns & chess.BB_FILES[file]):
+            doubled += count - 1
+            if not pawns & ADJACENT_FILES[file]:
+                isolated += count
+
+    passed = [0] * 8
+    for square in chess.scan_forward(pawns):
+        if not enemy_pawns & PASSED_PAWN_MASKS[color][square]:
+            rank = chess.square_rank(square)
+            passed[rank if color else 7 - rank] += 1
+
+    return doubled, isolated, passed
+
+
+def evaluate_pawn_structure(board: chess.BaseBoard) -> int:
+    """
+    Scores doubled, isolated and passed pawns. Pawn structures recur far more
+    often than whole positions, so scores are cached by the pawn bitboards.
+
+    Args:
+        board (chess.BaseBoard): The current state of the chess board.
+
+    Returns:
+        int: The pawn-structure score from white's point of view.
+    """
+
+    white = board.pawns & board.occupied_co[chess.WHITE]
+    black = board.pawns & board.occupied_co[chess.BLACK]
+
+    # Probe the pawn cache
+    key = (white, black)
+    index = hash(key) & (PAWN_CACHE_SIZE - 1)
+    CACHE_STATS["pawn_probes"] += 1
+    if (entry := pawn_cache[index]) is not None and entry[0] == key:
+        CACHE_STATS["pawn_hits"] += 1
+        return entry[1]
+
+    res = 0
+    sides = ((chess.WHITE, white, black), (chess.BLACK, black, white))
+    for color, pawns, enemy_pawns in sides:
+        doubled, isolated, passed = count_pawn_structure(
+            pawns, enemy_pawns, color,
+        )
+        val = doubled * PAWN_STRUCTURE["doubled"]
+        val += isolated * PAWN_STRUCTURE["isolated"]
+        val += sum(count * bonus for count, bonus in zip(passed, PASSED_PAWN))
+        res += val * (-1)**bool(not color)
+
+    pawn_cache[index] = (key, res)
+    return res
+
+
 def evaluate_board(board: chess.Board) -> int:
     """
     Evaluates the current state of the chess board by assigning a numerical
-    score based on the value of the pieces and their position.
+    score based on the value of the pieces, their position and the pawn
+    structure. Scores are cached by piece placement, since the same position
+    is reached through many move orders.
 
     Args:
         board (chess.Board): The current state of the chess board.
@@ -165,8 +341,19 @@ def evaluate_board(board: chess.Board) -> int:
         int: The numerical score of the board evaluation.
     """
 
+    # Probe the evaluation cache, keyed by the piece placement bitboards
+    key = (
+        board.pawns, board.knights, board.bishops, board.rooks, board.queens,
+        board.kings, board.occupied_co[chess.WHITE],
+    )
+    index = hash(key) & (EVAL_CACHE_SIZE - 1)
+    CACHE_STATS["eval_probes"] += 1
+    if (entry := eval_cache[index]) is not None and entry[0] == key:
+        CACHE_STATS["eval_hits"] += 1
+        return entry[1]
+
     # Initialize the result and check if the game is in the endgame phase
-    res: int = 0
+    res: int = evaluate_pawn_structure(board)
     endgame: bool = check_endgame(board)
 
     # Evaluate each piece on the board and add its value to the result
@@ -175,6 +362,7 @@ def evaluate_board(board: chess.Board) -> int:
         res += val * (-1)**bool(not piece.color)
 
     # Return the final evaluation score
+    eval_cache[index] = (key, res)
     return res
 
 
@@ -213,3 +401,8 @@ def check_endgame(board: chess.Board) -> bool:
         black_queens == 1 and black_minor <= 1
     )
     return white_endgame and black_endgame
+
+
+# Load tuned weights at startup if requested through the environment
+if weights_path := os.environ.get("OSMANTHUS_WEIGHTS"):  # pragma: no cover
+    load_weights(weights_path)
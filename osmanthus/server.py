@@ -0,0 +1,394 @@
+# This file implements a local analysis server backed by a pool of engines.
+# Requests and responses are JSON objects, one per line, over TCP:
+#
+#   -> {"id": 1, "fen": "...", "depth": 4, "movetime": 5, "multipv": 3}
+#   -> {"id": 2, "fen": "...", "depth": 4, "nodes": 20000, "book": false}
+#   <- {"id": 1, "bestmove": "e2e4", "score": 35, "depth": 4, ...}
+#   -> {"cancel": 1}
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from multiprocessing.managers import SyncManager
+
+import chess
+
+from osmanthus import endgame
+from osmanthus import engine
+
+logger = logging.getLogger(__name__)
+
+# Bound on the move-ordering table kept warm in each worker process
+MAX_TABLE_ENTRIES = 500_000
+
+
+def warm_up(weights: str | None = None) -> None:
+    """
+    Prepares a worker process: loads the evaluation weights, maps the opening
+    book, loads the endgame tables and runs a tiny search so that every table
+    is built before the first request arrives.
+
+    Args:
+        weights (str | None, optional): A weights file written by `tune`.
+
+    Returns:
+        None.
+    """
+
+    if weights:
+        from osmanthus.evaluate import load_weights
+        load_weights(weights)
+    engine.get_opening_database_moves(chess.Board())
+    endgame.load_tables()
+    board = chess.Board("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1")
+    engine.get_engine_move(board, 1, 1)
+
+
+def analyse(
+    fen: str, depth: int, movetime: float, multipv: int,
+    nodes: int | None = None, book: bool = True,
+    stop: threading.Event | None = None,
+) -> dict:
+    """
+    Analyses a single position inside a worker process. The move-ordering
+    table is kept between requests, so later searches of related positions
+    start warm.
+
+    Args:
+        fen (str): The position in FEN notation.
+        depth (int): The maximum search depth.
+        movetime (float): The time limit in seconds.
+        multipv (int): The number of root moves to report.
+        nodes (int, optional): A node limit replacing the time limit, which
+        makes the result reproducible.
+        book (bool, optional): Whether to play from the opening book.
+        stop (threading.Event, optional): Ends the analysis as soon as it is
+        set, with the lines searched so far.
+
+    Returns:
+        dict: The best move, score (white's view), depth, nodes, time and the
+        best `multipv` root moves, each with its own score and depth.
+    """
+
+    # Keep the per-process table from growing without bound
+    if len(engine.move_scores) > MAX_TABLE_ENTRIES:
+        engine.move_scores.clear()
+
+    # Every line gets an equal share of the time, or the full node budget
+    board = chess.Board(fen)
+    movetime /= multipv
+
+    # Book moves use a fixed seed, so identical requests get identical answers
+    move = engine.get_engine_move(
+        board, depth, movetime, book=book, nodes=nodes, seed=0, stop=stop,
+    )
+    info = dict(engine.DEBUG_INFO)
+    lines = [{
+        "move": move.uci(), "score": info.get("score"),
+        "depth": info.get("depth", 0),
+    }]
+    nodes_searched, time_taken = info["nodes"], info["time"]
+
+    # Search the root again without the moves already reported, so every
+    # line has an exact score of its own
+    excluded = {move}
+    while len(lines) < multipv:
+        search_moves = [m for m in board.legal_moves if m not in excluded]
+        if not search_moves or (stop is not None and stop.is_set()):
+            break
+        move = engine.get_engine_move(
+            board, depth, movetime, nodes=nodes, stop=stop,
+            search_moves=search_moves,
+        )
+        nodes_searched += engine.DEBUG_INFO["nodes"]
+        time_taken += engine.DEBUG_INFO["time"]
+        if "score" not in engine.DEBUG_INFO:
+            break
+        lines.append({
+            "move": move.uci(), "score": engine.DEBUG_INFO["score"],
+            "depth": engine.DEBUG_INFO["depth"],
+        })
+        excluded.add(move)
+
+    return {
+        "bestmove": lines[0]["move"],
+        "score": info.get("score"),
+        "depth": info.get("depth", 0),
+        "nodes": nodes_searched,
+        "time": time_taken,
+        "multipv": lines,
+    }
+
+
+class RequestError(Exception):
+    """A request that could not be served; the client gets the message."""
+
+
+@dataclass
+class Job:
+    """
+    A queued analysis, shared by every client asking for the same position.
+
+    Attributes:
+        key (tuple): The (fen, depth, movetime, multipv, nodes, book) key.
+        future (asyncio.Future): Resolves to the analysis result.
+        deadline (float): Latest event-loop time any waiter still needs it.
+        stop (threading.Event): Stops the search in the worker process once
+        nobody is waiting for the result anymore.
+        waiters (int): Number of requests currently awaiting the result.
+    """
+
+    key: tuple
+    future: asyncio.Future
+    deadline: float
+    stop: threading.Event
+    waiters: int = field(default=0)
+
+
+class AnalysisServer:
+    """
+    An asyncio server that dispatches analysis requests to a pool of warm
+    engine processes. Identical in-flight requests share a single search, the
+    request queue is bounded (excess requests are rejected with "busy"), and
+    each request carries a deadline that also caps the search time. A search
+    is stopped as soon as every request waiting for it has been cancelled or
+    has run out of time, freeing its worker.
+    """
+
+    def __init__(
+        self, workers: int | None = None, queue_size: int = 256,
+        default_deadline: float = 30.0, weights: str | None = None,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.default_deadline = default_deadline
+        self.weights = weights
+        self.inflight: dict[tuple, Job] = {}
+        self.queue: asyncio.Queue[Job]
+        self.pool: ProcessPoolExecutor
+        self.manager: SyncManager
+        self.dispatchers: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """
+        Starts and warms up the worker processes and the dispatchers.
+        """
+
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.queue_size)
+
+        # Stop flags have to be shared with the worker processes
+        self.manager = multiprocessing.Manager()
+        self.pool = ProcessPoolExecutor(
+            self.workers, initializer=warm_up, initargs=(self.weights,),
+        )
+
+        # Make sure every worker has started (and warmed up) before serving
+        await asyncio.gather(*(
+            loop.run_in_executor(self.pool, os.getpid)
+            for _ in range(self.workers)
+        ))
+        self.dispatchers = [
+            asyncio.create_task(self.dispatch()) for _ in range(self.workers)
+        ]
+
+    async def close(self) -> None:
+        """
+        Stops the dispatchers and shuts the worker processes down.
+        """
+
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        for job in self.inflight.values():
+            job.stop.set()
+            job.future.cancel()
+        self.pool.shutdown(cancel_futures=True)
+        self.manager.shutdown()
+
+    async def dispatch(self) -> None:
+        """
+        Feeds queued jobs to the process pool, one at a time per dispatcher,
+        skipping jobs nobody is waiting for anymore.
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                remaining = job.deadline - loop.time()
+                if job.future.done() or not job.waiters or remaining <= 0:
+                    job.future.cancel()
+                    continue
+
+                # Never search past the deadline of the latest waiter
+                fen, depth, movetime, multipv, nodes, book = job.key
+                result = await loop.run_in_executor(
+                    self.pool, analyse, fen, depth,
+                    min(movetime, remaining), multipv, nodes, book, job.stop,
+                )
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as error:
+                logger.exception("Analysis of %s failed", job.key[0])
+                if not job.future.done():
+                    job.future.set_exception(error)
+            finally:
+                if self.inflight.get(job.key) is job:
+                    del self.inflight[job.key]
+
+    async def submit(self, request: dict) -> dict:
+        """
+        Analyses a position, sharing the search with identical requests that
+        are already in flight.
+
+        Args:
+            request (dict): The request with a `fen` and optional `depth`,
+            `movetime` (seconds), `multipv`, `nodes`, `book` and `deadline`
+            (seconds).
+
+        Returns:
+            dict: The analysis result.
+        """
+
+        try:
+            fen = chess.Board(request["fen"]).fen()
+            depth = max(1, int(request.get("depth", 3)))
+            movetime = float(request.get("movetime", 15))
+            if not movetime > 0:
+                raise ValueError("movetime must be positive")
+            multipv = max(1, int(request.get("multipv", 1)))
+            nodes = request.get("nodes")
+            nodes = None if nodes is None else max(1, int(nodes))
+            book = bool(request.get("book", True))
+            timeout = float(request.get("deadline", self.default_deadline))
+        except (KeyError, TypeError, ValueError) as error:
+            raise RequestError(f"invalid request: {error}") from None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        key = (fen, depth, movetime, multipv, nodes, book)
+
+        if (job := self.inflight.get(key)) is None:
+            if self.queue.full():
+                raise RequestError("busy")
+            job = Job(
+                key, loop.create_future(), deadline, self.manager.Event(),
+            )
+            self.inflight[key] = job
+            self.queue.put_nowait(job)
+
+        job.deadline = max(job.deadline, deadline)
+        job.waiters += 1
+        try:
+            # Shield the shared job so one waiter leaving doesn't cancel it
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            raise RequestError("deadline exceeded") from None
+        finally:
+            # Free the worker once nobody needs the result, and let later
+            # identical requests start a fresh search
+            job.waiters -= 1
+            if not job.waiters and not job.future.done():
+                job.stop.set()
+                if self.inflight.get(key) is job:
+                    del self.inflight[key]
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Serves one connection. Requests are handled concurrently and answered
+        as they complete, tagged with the request `id`.
+        """
+
+        # Every request is tracked, with or without an id; the latest request
+        # with a given id is the one `{"cancel": id}` cancels
+        pending: dict[int, asyncio.Task] = {}
+        by_id: dict[object, asyncio.Task] = {}
+        count = 0
+
+        def send(response: dict) -> None:
+            writer.write(json.dumps(response).encode() + b"\n")
+
+        async def respond(
+            number: int, request_id: object, request: dict,
+        ) -> None:
+            try:
+                response = await self.submit(request)
+            except RequestError as error:
+                response = {"error": str(error)}
+            except asyncio.CancelledError:
+                response = {"error": "cancelled"}
+            except Exception as error:
+                response = {"error": f"analysis failed: {error}"}
+            finally:
+                task = pending.pop(number, None)
+                if by_id.get(request_id) is task:
+                    del by_id[request_id]
+            send({"id": request_id, **response})
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as error:
+                    send({"error": str(error)})
+                    continue
+
+                # Cancel an earlier request from this connection
+                if "cancel" in request:
+                    try:
+                        if task := by_id.get(request["cancel"]):
+                            task.cancel()
+                    except TypeError:
+                        pass
+                    continue
+
+                request_id = request.get("id")
+                count += 1
+                task = asyncio.create_task(respond(count, request_id, request))
+                pending[count] = task
+                if request_id is not None:
+                    try:
+                        by_id[request_id] = task
+                    except TypeError:
+                        pass
+
+            # The client is done sending; finish what it asked for
+            await asyncio.gather(
+                *list(pending.values()), return_exceptions=True,
+            )
+            await writer.drain()
+        except ConnectionError:
+            for task in list(pending.values()):
+                task.cancel()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        """
+        Starts the workers and serves requests until cancelled.
+
+        Args:
+            host (str, optional): The address to listen on.
+            port (int, optional): The port to listen on.
+        """
+
+        await self.start()
+        server = await asyncio.start_server(self.handle_client, host, port)
+        logger.info("Serving analysis on %s:%s", host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.close()
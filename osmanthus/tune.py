@@ -0,0 +1,417 @@
+# This file implements Texel-style tuning of the evaluation weights
+# https://www.chessprogramming.org/Texel%27s_Tuning_Method
+from __future__ import annotations
+
+import json
+import math
+from collections.abc import Iterable
+from collections.abc import Iterator
+from pathlib import Path
+from typing import NamedTuple
+from typing import TextIO
+
+import chess
+import numpy as np
+
+from osmanthus.evaluate import count_pawn_structure
+from osmanthus.evaluate import KING_ENDGAME
+from osmanthus.evaluate import PASSED_PAWN
+from osmanthus.evaluate import PAWN_STRUCTURE
+from osmanthus.evaluate import PIECE_VALUE
+from osmanthus.evaluate import PST
+
+# The king value always cancels out, so only pawn..queen are tuned
+MATERIAL_TYPES = [
+    chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN,
+]
+
+# Dense terms: material, doubled and isolated pawns, passed pawns per rank
+DENSE_SIZE = len(MATERIAL_TYPES) + len(PAWN_STRUCTURE) + len(PASSED_PAWN)
+
+# Table slots 0-5 hold PST[piece_type], slot 6 holds KING_ENDGAME
+KING_ENDGAME_SLOT = 6
+TABLE_SIZE = 7 * 64
+MAX_PIECES = 32
+
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+
+class Features(NamedTuple):
+    """
+    A compact, sparse feature matrix for a set of labelled positions.
+
+    Attributes:
+        dense (np.ndarray): (N, 15) int8 white-minus-black counts of pieces,
+        doubled, isolated and passed pawns.
+        indices (np.ndarray): (N, 32) uint16 indices into the PST weights.
+        signs (np.ndarray): (N, 32) int8 piece colors (+1, -1, or 0 padding).
+        results (np.ndarray): (N,) float32 game results from white's view.
+    """
+
+    dense: np.ndarray
+    indices: np.ndarray
+    signs: np.ndarray
+    results: np.ndarray
+
+
+def parse_result(token: str) -> float | None:
+    """
+    Parses a game result label such as "1-0", "[0.5]" or "\"1/2-1/2\"".
+
+    Args:
+        token (str): The result token.
+
+    Returns:
+        float | None: The result from white's point of view, or None if the
+        token is not a result.
+    """
+
+    token = token.strip("[]\"';")
+    if token in RESULTS:
+        return RESULTS[token]
+    try:
+        result = float(token)
+    except ValueError:
+        return None
+    return result if 0.0 <= result <= 1.0 else None
+
+
+def read_labelled_positions(
+    lines: Iterable[str],
+) -> Iterator[tuple[str, float]]:
+    """
+    Streams (fen, result) pairs from lines of labelled data. Each line holds a
+    FEN (or EPD) followed by the game result as its last token, e.g.
+    "<fen> [1-0]", "<fen> 0.5" or "<fen>; 1/2-1/2". Malformed lines, and lines
+    without a result after the position, are skipped.
+
+    Args:
+        lines (Iterable[str]): Lines of labelled data.
+
+    Yields:
+        tuple[str, float]: The position and the result from white's view.
+    """
+
+    for line in lines:
+        tokens = [token.rstrip("|;,") for token in line.split()]
+
+        # The position is an EPD, or a FEN if both move counters follow it, so
+        # the fullmove number of an unlabelled FEN is never taken as a result
+        counters = tokens[4:6]
+        is_fen = len(counters) == 2 and all(map(str.isdigit, counters))
+        size = 6 if is_fen else 4
+        if len(tokens) <= size:
+            continue
+        if (result := parse_result(tokens[-1])) is not None:
+            yield " ".join(tokens[:size]), result
+
+
+def extract_features(
+    fen: str,
+) -> tuple[list[int], list[int], list[int]] | None:
+    """
+    Converts a position into its material and pawn-structure counts and the
+    PST weights it uses. The indexing mirrors `osmanthus.evaluate.get_pst`, so
+    the dot product of the features with the weights equals `evaluate_board`.
+
+    Args:
+        fen (str): The position in FEN notation (only the placement is used).
+
+    Returns:
+        tuple | None: The dense counts, PST indices and signs, or None if the
+        position could not be parsed.
+    """
+
+    try:
+        board = chess.BaseBoard(fen.split()[0])
+    except (IndexError, ValueError):
+        return None
+    piece_map = board.piece_map()
+    if len(piece_map) > MAX_PIECES:
+        return None
+
+    # Count pieces per color to detect the endgame like `check_endgame`
+    counts = {chess.WHITE: [0] * 7, chess.BLACK: [0] * 7}
+    for piece in piece_map.values():
+        counts[piece.color][piece.piece_type] += 1
+
+    def is_endgame(color: chess.Color) -> bool:
+        queens = counts[color][chess.QUEEN]
+        minors = sum(counts[color][chess.KNIGHT:chess.QUEEN])
+        return queens == 0 or (queens == 1 and minors <= 1)
+
+    endgame = is_endgame(chess.WHITE) and is_endgame(chess.BLACK)
+
+    dense = [
+        counts[chess.WHITE][piece_type] - counts[chess.BLACK][piece_type]
+        for piece_type in MATERIAL_TYPES
+    ]
+
+    # Pawn-structure counts, in the order of PAWN_STRUCTURE and PASSED_PAWN
+    white = board.pawns & board.occupied_co[chess.WHITE]
+    black = board.pawns & board.occupied_co[chess.BLACK]
+    white_doubled, white_isolated, white_passed = count_pawn_structure(
+        white, black, chess.WHITE,
+    )
+    black_doubled, black_isolated, black_passed = count_pawn_structure(
+        black, white, chess.BLACK,
+    )
+    dense += [white_doubled - black_doubled, white_isolated - black_isolated]
+    dense += [w - b for w, b in zip(white_passed, black_passed)]
+
+    indices, signs = [], []
+    for square, piece in piece_map.items():
+        if endgame and piece.piece_type == chess.KING:
+            slot = KING_ENDGAME_SLOT
+        else:
+            slot = piece.piece_type - 1
+        # White reads the table reversed, black reads it as written
+        offset = 63 - square if piece.color else square
+        indices.append(slot * 64 + offset)
+        signs.append(1 if piece.color else -1)
+
+    return dense, indices, signs
+
+
+def build_features(
+    positions: Iterable[tuple[str, float]], chunk_size: int = 65_536,
+) -> Features:
+    """
+    Streams labelled positions into a compact feature matrix. Positions are
+    converted in fixed-size chunks so memory stays proportional to the output.
+
+    Args:
+        positions (Iterable[tuple[str, float]]): (fen, result) pairs.
+        chunk_size (int, optional): Positions converted per chunk.
+
+    Returns:
+        Features: The feature matrix for all parseable positions.
+    """
+
+    chunks: list[Features] = []
+
+    def new_chunk() -> Features:
+        return Features(
+            np.zeros((chunk_size, DENSE_SIZE), dtype=np.int8),
+            np.zeros((chunk_size, MAX_PIECES), dtype=np.uint16),
+            np.zeros((chunk_size, MAX_PIECES), dtype=np.int8),
+            np.zeros(chunk_size, dtype=np.float32),
+        )
+
+    chunk, row = new_chunk(), 0
+    for fen, result in positions:
+        if (features := extract_features(fen)) is None:
+            continue
+        dense, indices, signs = features
+        chunk.dense[row] = dense
+        chunk.indices[row, :len(indices)] = indices
+        chunk.signs[row, :len(signs)] = signs
+        chunk.results[row] = result
+        row += 1
+        if row == chunk_size:
+            chunks.append(chunk)
+            chunk, row = new_chunk(), 0
+
+    # Trim the last, partially filled chunk
+    chunks.append(Features(*(array[:row] for array in chunk)))
+    return Features(*(np.concatenate(arrays) for arrays in zip(*chunks)))
+
+
+def initial_weights() -> np.ndarray:
+    """
+    Returns the evaluator's current weights as a flat vector: the material
+    values for pawn..queen, the pawn-structure terms, then the six PSTs and
+    KING_ENDGAME.
+
+    Returns:
+        np.ndarray: The float64 weight vector.
+    """
+
+    tables = [PST[piece_type] for piece_type in chess.PIECE_TYPES]
+    tables.append(KING_ENDGAME)
+    return np.concatenate([
+        np.array([PIECE_VALUE[pt] for pt in MATERIAL_TYPES], dtype=np.float64),
+        np.array(list(PAWN_STRUCTURE.values()), dtype=np.float64),
+        np.array(PASSED_PAWN, dtype=np.float64),
+        np.array(tables, dtype=np.float64).ravel(),
+    ])
+
+
+def evaluate_features(features: Features, weights: np.ndarray) -> np.ndarray:
+    """
+    Evaluates every position of a feature matrix at once.
+
+    Args:
+        features (Features): The feature matrix.
+        weights (np.ndarray): The flat weight vector.
+
+    Returns:
+        np.ndarray: The evaluation of each position, in centipawns.
+    """
+
+    dense = features.dense @ weights[:DENSE_SIZE]
+    tables = weights[DENSE_SIZE:]
+    return dense + (tables[features.indices] * features.signs).sum(axis=1)
+
+
+def loss(features: Features, weights: np.ndarray, k: float = 1.0) -> float:
+    """
+    Computes the mean logistic (cross-entropy) loss of the weights.
+
+    Args:
+        features (Features): The feature matrix.
+        weights (np.ndarray): The flat weight vector.
+        k (float, optional): The centipawn-to-probability scaling constant.
+
+    Returns:
+        float: The mean loss over all positions.
+    """
+
+    scale = k * math.log(10) / 400
+    logits = evaluate_features(features, weights) * scale
+    # log(1 + e^x) - y * x, written to be stable for large |x|
+    return float(np.mean(np.logaddexp(0, logits) - features.results * logits))
+
+
+def gradient(
+    features: Features, weights: np.ndarray, k: float = 1.0,
+) -> np.ndarray:
+    """
+    Computes the gradient of `loss` with respect to the weights.
+
+    Args:
+        features (Features): The feature matrix.
+        weights (np.ndarray): The flat weight vector.
+        k (float, optional): The centipawn-to-probability scaling constant.
+
+    Returns:
+        np.ndarray: The gradient, shaped like the weights.
+    """
+
+    scale = k * math.log(10) / 400
+    logits = evaluate_features(features, weights) * scale
+    error = (1 / (1 + np.exp(-logits)) - features.results) * scale
+    error /= len(error)
+
+    grad = np.empty_like(weights)
+    grad[:DENSE_SIZE] = features.dense.T @ error
+    grad[DENSE_SIZE:] = np.bincount(
+        features.indices.ravel(),
+        weights=(features.signs * error[:, None]).ravel(),
+        minlength=TABLE_SIZE,
+    )
+    return grad
+
+
+def fit(
+    features: Features, weights: np.ndarray | None = None, epochs: int = 20,
+    batch_size: int = 16_384, learning_rate: float = 1.0, k: float = 1.0,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Fits the weights with mini-batch Adam on the logistic loss.
+
+    Args:
+        features (Features): The feature matrix.
+        weights (np.ndarray, optional): Starting weights. Defaults to the
+        evaluator's current weights.
+        epochs (int, optional): Passes over the data.
+        batch_size (int, optional): Positions per gradient step.
+        learning_rate (float, optional): Step size, in centipawns.
+        k (float, optional): The centipawn-to-probability scaling constant.
+        seed (int, optional): Seed for shuffling the batches.
+
+    Returns:
+        np.ndarray: The fitted weight vector.
+    """
+
+    weights = initial_weights() if weights is None else weights.copy()
+    rng = np.random.default_rng(seed)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    moment, velocity = np.zeros_like(weights), np.zeros_like(weights)
+    step = 0
+
+    for _ in range(epochs):
+        order = rng.permutation(len(features.results))
+        for start in range(0, len(order), batch_size):
+            batch_order = order[start:start + batch_size]
+            batch = Features(*(array[batch_order] for array in features))
+            grad = gradient(batch, weights, k)
+
+            # Adam update with bias-corrected moments
+            step += 1
+            moment = beta1 * moment + (1 - beta1) * grad
+            velocity = beta2 * velocity + (1 - beta2) * grad**2
+            moment_hat = moment / (1 - beta1**step)
+            velocity_hat = velocity / (1 - beta2**step)
+            denominator = np.sqrt(velocity_hat) + epsilon
+            weights -= learning_rate * moment_hat / denominator
+
+    return weights
+
+
+def weights_to_dict(weights: np.ndarray) -> dict:
+    """
+    Converts a flat weight vector into the JSON layout read by
+    `osmanthus.evaluate.load_weights`.
+
+    Args:
+        weights (np.ndarray): The flat weight vector.
+
+    Returns:
+        dict: The rounded weights keyed by piece name.
+    """
+
+    values = np.rint(weights).astype(int).tolist()
+    material = values[:len(MATERIAL_TYPES)]
+    values = values[len(MATERIAL_TYPES):]
+    pawn_structure = values[:len(PAWN_STRUCTURE)]
+    values = values[len(PAWN_STRUCTURE):]
+    passed, tables = values[:len(PASSED_PAWN)], values[len(PASSED_PAWN):]
+    return {
+        "piece_value": {
+            chess.piece_name(pt): value
+            for pt, value in zip(MATERIAL_TYPES, material)
+        },
+        "pst": {
+            chess.piece_name(pt): tables[(pt - 1) * 64:pt * 64]
+            for pt in chess.PIECE_TYPES
+        },
+        "king_endgame": tables[KING_ENDGAME_SLOT * 64:],
+        "pawn_structure": {
+            **dict(zip(PAWN_STRUCTURE, pawn_structure)),
+            "passed": passed,
+        },
+    }
+
+
+def tune(
+    data: TextIO, output: str | Path, epochs: int = 20,
+    batch_size: int = 16_384, learning_rate: float = 1.0, k: float = 1.0,
+) -> float:
+    """
+    Tunes the evaluation weights on labelled data and writes a weights file.
+
+    Args:
+        data (TextIO): Lines of labelled positions.
+        output (str | Path): Path of the JSON weights file to write.
+        epochs (int, optional): Passes over the data.
+        batch_size (int, optional): Positions per gradient step.
+        learning_rate (float, optional): Step size, in centipawns.
+        k (float, optional): The centipawn-to-probability scaling constant.
+
+    Returns:
+        float: The final loss over all positions.
+    """
+
+    features = build_features(read_labelled_positions(data))
+    if not len(features.results):
+        raise ValueError("No labelled positions found")
+
+    weights = fit(
+        features, epochs=epochs, batch_size=batch_size,
+        learning_rate=learning_rate, k=k,
+    )
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(weights_to_dict(weights), file)
+    return loss(features, weights, k)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import io
+
+import chess.pgn
+
+from osmanthus.annotate import annotate
+from osmanthus.annotate import annotate_game
+
+SCHOLARS_MATE = """[Event "Scholar's mate"]
+[Result "1-0"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+"""
+
+
+def test_annotate_game() -> None:
+    """
+    Test that every move gets a comment and that the move allowing mate is
+    marked as a blunder with the engine's alternative.
+    """
+
+    game = chess.pgn.read_game(io.StringIO(annotate_game(SCHOLARS_MATE, 2, 5)))
+    assert game is not None
+    nodes = list(game.mainline())
+
+    assert all(node.comment for node in nodes)
+    assert nodes[0].comment.startswith("[%eval ")
+    assert chess.pgn.NAG_BLUNDER in nodes[5].nags
+    assert "Best move was" in nodes[5].comment
+    assert nodes[-1].comment == "White mates."
+
+
+def test_annotate_stream() -> None:
+    """
+    Test that games are streamed through in order and counted.
+    """
+
+    source = io.StringIO(SCHOLARS_MATE + "\n" + SCHOLARS_MATE)
+    output = io.StringIO()
+
+    assert annotate(source, output, depth=1, limit=5) == 2
+    output.seek(0)
+    games = []
+    while (game := chess.pgn.read_game(output)) is not None:
+        games.append(game)
+    assert len(games) == 2
+    assert all(node.comment for game in games for node in game.mainline())
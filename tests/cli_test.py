@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 import io
+import json
+import subprocess
 import sys
+from pathlib import Path
 
 import chess
+import pytest
 
+from osmanthus.cli import build_parser
 from osmanthus.cli import get_user_move
+from osmanthus.cli import main
 from osmanthus.cli import print_fancy_board
 
 
@@ -61,3 +67,62 @@ def test_get_user_move(monkeypatch):
         monkeypatch.setattr('builtins.input', lambda _: move)
         # Assert that returned move object is None
         assert get_user_move(board) is None
+
+
+def test_tune_command(tmp_path) -> None:
+    """
+    Test that the tune subcommand writes a loadable weights file.
+    """
+
+    pytest.importorskip("numpy")
+    data = tmp_path / "positions.txt"
+    data.write_text(f"{chess.STARTING_FEN} [1/2-1/2]\n", encoding="utf-8")
+    output = tmp_path / "weights.json"
+
+    assert main(["tune", str(data), "-o", str(output), "--epochs", "1"]) == 0
+    assert set(json.loads(output.read_text(encoding="utf-8"))) == {
+        "piece_value", "pst", "king_endgame", "pawn_structure",
+    }
+
+    # Input without labelled positions is an error, not a traceback
+    data.write_text("not a position\n", encoding="utf-8")
+    assert main(["tune", str(data), "-o", str(output)]) == 1
+
+
+def test_bestmove_command(capsys) -> None:
+    """
+    Test that the bestmove subcommand prints a legal move in UCI notation.
+    """
+
+    fen = "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"
+    assert main(["bestmove", "--fen", fen, "--depth", "2", "--no-book"]) == 0
+    assert capsys.readouterr().out.strip() == "a1a8"
+
+    # Options given before the subcommand aren't reset by its defaults
+    parser = build_parser()
+    args = parser.parse_args(
+        ["--weights", "w.json", "--depth", "5", "bestmove"],
+    )
+    assert (args.weights, args.depth) == ("w.json", 5)
+    assert args.fen == chess.STARTING_FEN
+    args = parser.parse_args(["--depth", "5", "bestmove", "--depth", "2"])
+    assert args.depth == 2
+
+    # Invalid and finished positions are reported as errors
+    assert main(["bestmove", "--fen", "invalid"]) == 2
+    assert main(["bestmove", "--fen", "7k/6Q1/6K1/8/8/8/8/8 b - - 0 1"]) == 1
+
+
+def test_import_is_lightweight() -> None:
+    """
+    Test that importing the CLI doesn't pull in modules only needed by other
+    commands.
+    """
+
+    code = "import sys, osmanthus.cli; print(*sorted(sys.modules))"
+    modules = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True,
+        check=True, cwd=Path(__file__).resolve().parent.parent,
+    ).stdout.split()
+    for module in ("asyncio", "logging", "json", "numpy", "osmanthus.server"):
+        assert module not in modules
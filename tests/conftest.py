@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Path]:
+    """
+    Keeps the endgame tables generated by the tests, including those of worker
+    processes, out of the user's cache directory.
+    """
+
+    path = tmp_path_factory.mktemp("cache")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("OSMANTHUS_CACHE_DIR", str(path))
+        yield path
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import chess
+import pytest
+
+from osmanthus import datagen
+
+
+def test_encode_decode() -> None:
+    """
+    Test that positions survive a round trip through the record format,
+    including castling rights, en passant and promotions.
+    """
+
+    board = chess.Board("r3k2r/1P6/8/3pP3/8/8/8/R3K2R w Kq d6 0 2")
+    move = chess.Move.from_uci("b7a8q")
+    record = datagen.encode_position(board, 1_000_000, move, -1)
+
+    assert len(record) == datagen.RECORD.size == 32
+    decoded, score, best_move, result = datagen.decode_position(record)
+    assert decoded.board_fen() == board.board_fen()
+    assert decoded.turn == board.turn
+    assert decoded.castling_rights == board.castling_rights
+    assert decoded.ep_square == board.ep_square
+    assert (score, best_move, result) == (datagen.MAX_SCORE, move, -1)
+
+
+def test_generate_and_read(tmp_path) -> None:
+    """
+    Test that generated shards are memory-mapped as NumPy records holding
+    legal best moves and a consistent game result.
+    """
+
+    np = pytest.importorskip("numpy")
+
+    count = datagen.generate(
+        tmp_path, games=1, nodes=100, depth=2, shard_size=25, opening_plies=4,
+    )
+    shards = datagen.read_shards(tmp_path)
+
+    assert count == sum(len(shard) for shard in shards) > 0
+    assert all(len(shard) <= 25 for shard in shards)
+
+    records = np.concatenate(shards)
+    assert len(set(records["result"].tolist())) == 1
+
+    pieces = datagen.unpack_pieces(records)
+    for record, codes in zip(records[:10], pieces):
+        board, _, move, _ = datagen.decode_position(record.tobytes())
+        assert move in board.legal_moves
+        for square in chess.SQUARES:
+            piece = board.piece_at(square)
+            expected = piece.piece_type + 8 * (not piece.color) if piece else 0
+            assert codes[square] == expected
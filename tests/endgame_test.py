@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import chess
+
+from osmanthus import endgame
+from osmanthus.engine import get_engine_move
+
+
+def test_probe() -> None:
+    """
+    Test the probe function on won and drawn positions of every table, for
+    both colors, and on positions the tables don't cover.
+    """
+
+    endgame.load_tables()
+
+    # KRK, white mates in one (Ra8#)
+    board = chess.Board("7k/8/6K1/8/8/8/8/R7 w - - 0 1")
+    assert endgame.probe(board) == endgame.TABLEBASE_WIN - 1
+
+    # The same position with colors reversed
+    assert endgame.probe(board.mirror()) == -(endgame.TABLEBASE_WIN - 1)
+
+    # KQK, black to move can capture the undefended queen
+    assert endgame.probe(chess.Board("8/8/8/8/8/8/2kQ4/7K b - - 0 1")) == 0
+
+    # KPK, won with black to move and drawn with white to move (opposition)
+    board = chess.Board("8/4k3/8/4K3/4P3/8/8/8 b - - 0 1")
+    score = endgame.probe(board)
+    assert score is not None and score > endgame.KNOWN_WIN
+    board.turn = chess.WHITE
+    assert endgame.probe(board) == 0
+
+    # Positions outside the tables
+    assert endgame.probe(chess.Board()) is None
+    board = chess.Board("4k3/8/8/8/8/8/8/2B1K3 w - - 0 1")
+    assert endgame.probe(board) is None
+
+
+def test_mate_with_rook() -> None:
+    """
+    Test that the engine mates with king and rook in exactly the number of
+    plies given by the table.
+    """
+
+    board = chess.Board("8/8/8/4k3/8/8/8/R3K3 w - - 0 1")
+    endgame.load_tables()
+    score = endgame.probe(board)
+    assert score is not None
+    plies = endgame.TABLEBASE_WIN - score
+
+    for _ in range(plies):
+        board.push(get_engine_move(board, 3, book=False))
+    assert board.is_checkmate()
+
+
+def test_probe_never_generates(monkeypatch) -> None:
+    """
+    Test that probing a position whose table isn't loaded doesn't stall the
+    search by generating it.
+    """
+
+    monkeypatch.setattr(endgame, "tables", {})
+    assert endgame.probe(chess.Board("7k/8/6K1/8/8/8/8/R7 w - - 0 1")) is None
+    assert endgame.tables == {}
+
+
+def test_table_cache(tmp_path, monkeypatch) -> None:
+    """
+    Test that a generated table is written to the cache directory and read
+    back from it.
+    """
+
+    monkeypatch.setenv("OSMANTHUS_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(endgame, "tables", {})
+    table = endgame.load_table(chess.ROOK)
+
+    path = tmp_path / f"krk-v{endgame.TABLE_VERSION}.bin"
+    assert path.read_bytes() == table
+
+    monkeypatch.setattr(endgame, "tables", {})
+    assert endgame.load_table(chess.ROOK) == table
+
+    # Without generating, only the cached table is loaded
+    monkeypatch.setattr(endgame, "tables", {})
+    endgame.load_tables(generate=False)
+    assert list(endgame.tables) == [chess.ROOK]
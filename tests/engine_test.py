@@ -1,10 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import sys
+import threading
+import time
+from dataclasses import replace
 from pathlib import Path
 
 import chess
 
+from osmanthus import endgame
+from osmanthus import engine
+from osmanthus.engine import DEBUG_INFO
+from osmanthus.engine import GameSession
 from osmanthus.engine import get_engine_move
+from osmanthus.engine import get_engine_move_async
 
 
 def test_mate_in_one() -> None:
@@ -81,6 +91,173 @@ def test_mate_in_three() -> None:
     #     assert board.is_checkmate()
 
 
+def test_node_limit_is_deterministic() -> None:
+    """
+    This function tests that a node-limited search gives the same move and
+    node count regardless of the searches that ran before it.
+    """
+
+    fen = "rnbqkbnr/ppp1pppp/8/3p4/2Q1P3/3P1P2/PPP1B1PP/RNB1K1NR w KQkq - 0 1"
+
+    results = []
+    for other_fen in (chess.STARTING_FEN, "8/4P3/2k5/8/8/3K4/8/8 w - - 0 1"):
+        # Search an unrelated position first to fill the move-ordering table
+        get_engine_move(chess.Board(other_fen), 2, book=False)
+        move = get_engine_move(chess.Board(fen), 5, book=False, nodes=2000)
+        results.append((move, DEBUG_INFO["nodes"]))
+
+    # A game session doesn't change a node-limited search either
+    session = GameSession()
+    get_engine_move(chess.Board(fen), 2, book=False, session=session)
+    move = get_engine_move(
+        chess.Board(fen), 5, book=False, nodes=2000, session=session,
+    )
+    results.append((move, DEBUG_INFO["nodes"]))
+
+    assert results[0] == results[1] == results[2]
+
+
+def test_node_limit_ignores_loaded_tables(monkeypatch) -> None:
+    """
+    This function tests that a node-limited search that can reach the endgame
+    tables gives the same result whether or not they were loaded before.
+    """
+
+    # Capturing the knight or the rook reaches KRK
+    fen = "8/8/3k4/8/3nR3/8/8/4K2r w - - 0 1"
+
+    # Search without any tables loaded, then with all of them
+    monkeypatch.setattr(endgame, "tables", {})
+    move = get_engine_move(chess.Board(fen), 6, book=False, nodes=5000)
+    result = (move, DEBUG_INFO["nodes"])
+
+    endgame.load_tables()
+    move = get_engine_move(chess.Board(fen), 6, book=False, nodes=5000)
+    assert (move, DEBUG_INFO["nodes"]) == result
+
+
+def test_quiescence_checks(monkeypatch) -> None:
+    """
+    This function tests that the quiescence search scores checkmates, and
+    finds mates with quiet checks at its first ply only if enabled.
+    """
+
+    def quiescence(fen: str) -> int:
+        DEBUG_INFO["nodes"] = 0
+        engine.quiescence_node_limit = engine.QUIESCENCE_NODE_BUDGET
+        board = chess.Board(fen)
+        return engine.quiescence_search(board, -sys.maxsize, sys.maxsize, 1)
+
+    # White is mated despite being a queen up
+    score = quiescence("4k3/8/8/8/Q7/8/5PPP/4r1K1 w - - 0 1")
+    assert score <= -engine.MATE_THRESHOLD
+
+    # Ra8# is a quiet move, found only by trying checks
+    back_rank = "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"
+    assert quiescence(back_rank) >= engine.MATE_THRESHOLD
+    monkeypatch.setattr(engine, "QUIESCENCE_CHECKS", False)
+    assert quiescence(back_rank) < engine.MATE_THRESHOLD
+
+
+def test_check_extension() -> None:
+    """
+    This function tests that a one-ply search sees the mate at the end of a
+    forcing check.
+    """
+
+    # Qh7+ Kf8 Qh8# needs three plies, but the check extends the search
+    board = chess.Board("6k1/8/5PK1/8/8/8/8/7Q w - - 0 1")
+    get_engine_move(board, 1, book=False)
+    assert DEBUG_INFO["score"] >= engine.MATE_THRESHOLD
+
+
+def test_game_session() -> None:
+    """
+    This function tests that a game session resumes the search one ply short
+    of the previous depth after the expected reply, and starts over after an
+    unexpected one.
+    """
+
+    board = chess.Board(
+        "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    )
+    session = GameSession()
+    board.push(get_engine_move(board, 3, book=False, session=session))
+    assert session.depth == 3
+    assert session.principal_variation[0] == board.peek()
+
+    # The expected reply resumes the search at depth 2
+    depths: list[int] = []
+    expected = board.copy()
+    expected.push(session.principal_variation[1])
+    get_engine_move(
+        expected, 3, book=False, session=replace(session),
+        on_iteration=lambda depth, move, score: depths.append(depth),
+    )
+    assert depths == [2, 3]
+
+    # Any other reply starts over
+    depths.clear()
+    board.push(next(
+        move for move in board.legal_moves
+        if move != session.principal_variation[1]
+    ))
+    get_engine_move(
+        board, 3, book=False, session=session,
+        on_iteration=lambda depth, move, score: depths.append(depth),
+    )
+    assert depths == [1, 2, 3]
+
+
+def test_book_seed() -> None:
+    """
+    This function tests that a seeded opening book choice is repeatable.
+    """
+
+    board = chess.Board()
+    moves = {get_engine_move(board, seed=42) for _ in range(5)}
+    assert len(moves) == 1
+
+
+def test_async_updates() -> None:
+    """
+    This function tests that the async search yields one update per
+    completed iteration, ending with the move the engine plays.
+    """
+
+    board = chess.Board("r4q1k/1b4bp/4Q2N/p7/Pp6/3P4/1PP1p1PP/5RK1 w - - 0 29")
+
+    async def run() -> list:
+        return [update async for update in get_engine_move_async(board, 2)]
+
+    updates = asyncio.run(run())
+    assert [depth for depth, _, _ in updates] == [1, 2]
+    assert updates[-1][1] == get_engine_move(board, 2)
+
+
+def test_async_stop() -> None:
+    """
+    This function tests that setting the stop event ends a long search
+    promptly with a legal move.
+    """
+
+    board = chess.Board()
+    stop = threading.Event()
+
+    async def run() -> list:
+        updates = []
+        search = get_engine_move_async(board, 20, 60, book=False, stop=stop)
+        async for update in search:
+            updates.append(update)
+            stop.set()
+        return updates
+
+    start = time.time()
+    updates = asyncio.run(run())
+    assert time.time() - start < 10
+    assert updates[-1][1] in board.legal_moves
+
+
 # The following tests are commented out, as they are currently not in use.
 
 # def test_stalemate() -> None:
@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import chess
 
+from osmanthus.evaluate import CACHE_STATS
 from osmanthus.evaluate import check_endgame
+from osmanthus.evaluate import count_pawn_structure
 from osmanthus.evaluate import evaluate_board
 from osmanthus.evaluate import is_favorable_move
 # from pathlib import Path
@@ -71,3 +73,38 @@ def test_evaluate_board() -> None:
         "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
     )
     assert evaluate_board(white_played_e4) > 0
+
+
+def test_pawn_structure() -> None:
+    """
+    Test the count_pawn_structure function on doubled, isolated and passed
+    pawns for both colors.
+    """
+
+    # White: doubled and isolated c-pawns, passed h-pawn on the 6th rank
+    # Black: connected a- and b-pawns, only the a-pawn is passed
+    board = chess.Board("4k3/p7/1p5P/8/8/2P5/2P5/4K3 w - - 0 1")
+    white = board.pawns & board.occupied_co[chess.WHITE]
+    black = board.pawns & board.occupied_co[chess.BLACK]
+
+    doubled, isolated, passed = count_pawn_structure(white, black, chess.WHITE)
+    assert (doubled, isolated) == (1, 3)
+    assert passed == [0, 0, 0, 0, 0, 1, 0, 0]
+
+    doubled, isolated, passed = count_pawn_structure(black, white, chess.BLACK)
+    assert (doubled, isolated) == (0, 0)
+    assert passed == [0, 1, 0, 0, 0, 0, 0, 0]
+
+
+def test_evaluation_cache() -> None:
+    """
+    Test that evaluating a position twice hits the evaluation cache and
+    returns the same score.
+    """
+
+    board = chess.Board("4k3/p7/1p5P/8/8/2P5/2P5/4K3 w - - 0 1")
+    score = evaluate_board(board)
+    hits = CACHE_STATS["eval_hits"]
+
+    assert evaluate_board(board) == score
+    assert CACHE_STATS["eval_hits"] == hits + 1
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import chess
+import pytest
+
+from osmanthus.server import AnalysisServer
+from osmanthus.server import analyse
+from osmanthus.server import RequestError
+
+POSITION_FEN = (
+    "rnbqkbnr/ppp1pppp/8/3p4/2Q1P3/3P1P2/PPP1B1PP/RNB1K1NR w KQkq - 0 1"
+)
+
+
+def test_analyse() -> None:
+    """
+    Test that a worker analysis returns a legal best move first in the
+    multipv list, followed by the next best moves with their own scores.
+    """
+
+    result = analyse(POSITION_FEN, 2, 5, 3)
+    board = chess.Board(POSITION_FEN)
+
+    assert chess.Move.from_uci(result["bestmove"]) in board.legal_moves
+    assert result["multipv"][0]["move"] == result["bestmove"]
+    assert len(result["multipv"]) == 3
+    assert len({line["move"] for line in result["multipv"]}) == 3
+    assert all(line["depth"] == 2 for line in result["multipv"])
+
+    # Every line is searched on its own, so the scores are in order
+    scores = [line["score"] for line in result["multipv"]]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == result["score"]
+    assert result["depth"] == 2
+
+
+def test_server_requests() -> None:
+    """
+    Test that identical in-flight requests share one search, that invalid
+    requests are rejected, and that responses are tagged with request ids.
+    """
+
+    async def run() -> None:
+        server = AnalysisServer(workers=1, queue_size=1)
+        await server.start()
+        try:
+            # Identical requests are deduplicated into a single job
+            request = {"fen": POSITION_FEN, "depth": 2}
+            first, second = await asyncio.gather(
+                server.submit(request), server.submit(request),
+            )
+            assert first is second
+
+            # Invalid positions are reported to the client
+            with pytest.raises(RequestError, match="invalid request"):
+                await server.submit({"fen": "not a fen"})
+
+            # Requests over TCP are answered with their id
+            tcp = await asyncio.start_server(
+                server.handle_client, "127.0.0.1", 0,
+            )
+            port = tcp.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(json.dumps({"id": 7, **request}).encode() + b"\n")
+            writer.write_eof()
+            response = json.loads(await reader.readline())
+            assert response["id"] == 7
+            assert response["bestmove"] == first["bestmove"]
+            writer.close()
+
+            # Requests without an id are all answered
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(json.dumps(request).encode() + b"\n")
+            writer.write(json.dumps({**request, "depth": 1}).encode() + b"\n")
+            writer.write_eof()
+            responses = [json.loads(line) async for line in reader]
+            assert len(responses) == 2
+            assert all(response["id"] is None for response in responses)
+            writer.close()
+            tcp.close()
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_server_limits() -> None:
+    """
+    Test that requests are rejected when the queue is full, that they fail
+    once their deadline passes, and that clients can cancel them, which stops
+    their search and frees the worker.
+    """
+
+    slow = {"fen": POSITION_FEN, "depth": 20, "movetime": 60, "book": False}
+    quick = {"fen": chess.STARTING_FEN, "depth": 1, "book": False}
+
+    async def run() -> None:
+        server = AnalysisServer(workers=1, queue_size=1)
+        await server.start()
+        loop = asyncio.get_running_loop()
+        try:
+            # One search runs and one waits in the queue; a third is rejected
+            searches = [
+                asyncio.create_task(server.submit({**slow, "movetime": 0.5})),
+            ]
+            await asyncio.sleep(0)
+            while not server.queue.empty():
+                await asyncio.sleep(0.01)
+            searches.append(
+                asyncio.create_task(server.submit({**slow, "movetime": 0.4})),
+            )
+            await asyncio.sleep(0)
+            with pytest.raises(RequestError, match="busy"):
+                await server.submit({**slow, "movetime": 0.3})
+            await asyncio.gather(*searches)
+
+            # A request fails once its deadline passes, which also caps its
+            # search below a second
+            with pytest.raises(RequestError, match="deadline exceeded"):
+                await server.submit({**slow, "deadline": 0.1})
+            start = loop.time()
+            await server.submit(quick)
+            assert loop.time() - start < 0.8
+
+            # A request can be cancelled by its id
+            tcp = await asyncio.start_server(
+                server.handle_client, "127.0.0.1", 0,
+            )
+            port = tcp.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            request = {"id": "a", **slow, "multipv": 4}
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            await asyncio.sleep(0.1)
+            writer.write(json.dumps({"cancel": "a"}).encode() + b"\n")
+            writer.write_eof()
+            response = json.loads(await reader.readline())
+            assert response == {"id": "a", "error": "cancelled"}
+            writer.close()
+
+            # The cancelled search stops instead of holding the worker
+            start = loop.time()
+            await server.submit(quick)
+            assert loop.time() - start < 5
+            tcp.close()
+        finally:
+            await server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import copy
+import io
+import json
+from pathlib import Path
+
+import chess
+import pytest
+
+from osmanthus import evaluate
+from osmanthus.evaluate import evaluate_board
+from osmanthus.evaluate import load_weights
+
+np = pytest.importorskip("numpy")
+tune = pytest.importorskip("osmanthus.tune")
+
+
+def test_read_labelled_positions() -> None:
+    """
+    Test that results are parsed in the supported formats and that malformed
+    lines, including positions without a result, are skipped.
+    """
+
+    data = io.StringIO(
+        f"{chess.STARTING_FEN} [1-0]\n"
+        f"{chess.STARTING_FEN}; 1/2-1/2\n"
+        f"{chess.STARTING_FEN} 0.0\n"
+        f"{chess.STARTING_FEN} *\n"
+        f"{chess.STARTING_FEN}\n"
+        "8/8/8/4k3/8/8/4P3/4K3 w - - 3 0\n"
+        "\n",
+    )
+    positions = list(tune.read_labelled_positions(data))
+    assert [result for _, result in positions] == [1.0, 0.5, 0.0]
+    assert all(fen == chess.STARTING_FEN for fen, _ in positions)
+
+
+def test_features_match_evaluate_board() -> None:
+    """
+    Test that evaluating the feature matrix with the current weights gives
+    exactly the same scores as `evaluate_board`, including endgames.
+    """
+
+    dir_path = Path(__file__).resolve().parent / "test_files"
+    with open(dir_path / "positions.fen", encoding="utf-8") as file:
+        fens = [line.strip() for line in file.readlines()]
+    with open(dir_path / "endgame.fen", encoding="utf-8") as file:
+        fens += [line.strip() for line in file.readlines()]
+    fens.append(chess.STARTING_FEN)
+
+    features = tune.build_features(((fen, 0.5) for fen in fens), chunk_size=2)
+    scores = tune.evaluate_features(features, tune.initial_weights())
+
+    assert len(scores) == len(fens)
+    for fen, score in zip(fens, scores):
+        assert score == evaluate_board(chess.Board(fen))
+
+
+def test_fit_reduces_loss() -> None:
+    """
+    Test that fitting lowers the loss on a small labelled data set, where
+    every position with an extra white knight was won by white.
+    """
+
+    won = "rnbqkb1r/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    drawn = chess.STARTING_FEN
+    features = tune.build_features([(won, 1.0), (drawn, 0.5)] * 8)
+
+    before = tune.loss(features, tune.initial_weights())
+    weights = tune.fit(features, epochs=50, batch_size=4, learning_rate=5.0)
+    assert tune.loss(features, weights) < before
+    assert tune.gradient(features, weights).shape == weights.shape
+
+
+def test_weights_round_trip(tmp_path) -> None:
+    """
+    Test that a written weights file is loaded back into the evaluator.
+    """
+
+    saved = copy.deepcopy(
+        (evaluate.PIECE_VALUE, evaluate.PST, evaluate.KING_ENDGAME),
+    )
+    weights = tune.initial_weights()
+    weights[0] = 123  # pawn value
+
+    path = tmp_path / "weights.json"
+    data = json.dumps(tune.weights_to_dict(weights))
+    path.write_text(data, encoding="utf-8")
+    try:
+        load_weights(path)
+        assert evaluate.PIECE_VALUE[chess.PAWN] == 123
+        assert evaluate.PST[chess.KNIGHT] == saved[1][chess.KNIGHT]
+    finally:
+        evaluate.PIECE_VALUE.update(saved[0])
+        for piece_type, table in saved[1].items():
+            evaluate.PST[piece_type][:] = table
+        evaluate.KING_ENDGAME[:] = saved[2]
+        evaluate.clear_caches()